@@ -14,7 +14,9 @@ https://github.com/toaarnio/imsize
 from .imsize import FILETYPES
 from .imsize import ImageInfo
 from .imsize import read
+from .imsize import read_many
+from .imsize import clear_cache
 from .imsize import ImageFileError
 from .version import __version__
 
-__all__ = ["read", "ImageInfo", "FILETYPES", "ImageFileError", "__version__"]
+__all__ = ["read", "read_many", "clear_cache", "ImageInfo", "FILETYPES", "ImageFileError", "__version__"]
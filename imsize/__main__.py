@@ -0,0 +1,7 @@
+"""
+Allows running the command-line application as 'python -m imsize'.
+"""
+
+from imsize import consoleapp
+
+consoleapp.main()
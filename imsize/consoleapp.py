@@ -3,13 +3,19 @@
 """
 Calculates the combined in-memory size of the given images by parsing
 their header information. Runs very fast because only the header part
-of a file is read from disk (except for headerless Camera RAW and Nikon
-NEF).
+of a file is read from disk (except for a sample of the pixels of headerless
+Camera RAW files, unless --fast is given).
 """
 
 import os              # built-in library
 import sys             # built-in library
-import glob            # built-in library
+import time            # built-in library
+import json            # built-in library
+import pickle          # built-in library
+import sqlite3         # built-in library
+import itertools       # built-in library
+import functools       # built-in library
+import concurrent.futures  # built-in library
 import imsize          # pip install imsize
 
 try:
@@ -20,12 +26,33 @@ except ImportError:
     import argv
 
 
+SUFFIXES = frozenset(imsize.FILETYPES)  # {".png", ".jpg", ...}
+
+_MB = 1 << 20  # bytes per megabyte
+
+MAX_WORKERS = min(32, (os.cpu_count() or 1) * 4)  # I/O bound, so more threads than cores
+
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "imsize")
+
+DIRCACHE_MAX_AGE = 30  # days; directories not scanned for this long are dropped from the cache
+
+INFOCACHE_MAX_AGE = 30  # days; files not scanned for this long are dropped from the cache
+
+_INFOCACHE_SCHEMA = 2  # bump when changing the table layout => old tables are dropped
+
+_SQL_BATCH = 500  # paths per SELECT, safely below the default limit of 999 parameters
+
+_RACY_NS = 2_000_000_000  # timestamp resolution of FAT/exFAT, the coarsest in common use
+
+
 def main():
     """
     Entry point for the 'imsize' command-line application.
     """
     show_all = argv.exists("--all")
     verbose = not argv.exists("--quiet")
+    use_cache = not argv.exists("--nocache")
+    fast = argv.exists("--fast")
     show_help = argv.exists("--help")
     argv.exitIfAnyUnparsedOptions()
     if show_help:
@@ -33,11 +60,13 @@ def main():
         print()
         print("  Displays the dimensions and uncompressed sizes of the given images.")
         print("  Runs very fast because only the header part of a file is read from")
-        print("  disk (except for headerless Camera RAW and Nikon NEF).")
+        print("  disk (except for a sample of the pixels of headerless Camera RAW files).")
         print()
         print("  options:")
         print("    --all               show all extracted per-image metadata")
         print("    --quiet             do not show per-image information")
+        print(f"    --nocache           do not use or update the cache in {CACHE_DIR}")
+        print("    --fast              assume 12 bits for headerless Camera RAW files")
         print("    --help              show this help message")
         print()
         print("  example:")
@@ -53,58 +82,278 @@ def main():
         if verbose:
             print("See 'imsize --help' for command-line options.")
         paths = sys.argv[1:] or ["."]  # scan current directory if no arguments
-        filespecs = find_files(paths)
-        scan_sizes(filespecs, verbose, show_all)
+        dircache = load_cache("dirlist.json") if use_cache else {}
+        orig_dircache = dict(dircache)
+        filespecs = find_files(paths, dircache)
+        if use_cache:
+            prune_dircache(dircache)
+        if use_cache and dircache != orig_dircache:
+            save_cache("dirlist.json", dircache)
+        infocache = open_infocache() if use_cache else None
+        scan_sizes(filespecs, verbose, show_all, infocache, fast)
+        if infocache is not None:
+            infocache.close()
 
 
-def find_files(paths):
+def find_files(paths, dircache=None):
     """
-    Collects all files with known filetypes from the given list of directories.
+    Collects all files with known filetypes from the given list of directories,
+    returning a list of (filespec, basename) tuples. Hidden files and
+    unreadable directories are skipped. If a dircache dict is given, directory
+    listings are looked up from there as long as the directory has not been
+    modified and imsize has not been upgraded, and updated otherwise. Listings
+    of directories that were modified within the timestamp resolution of the
+    file system are not cached, because further changes within the same tick
+    would go unnoticed.
     """
-    allfiles = []
-    for path in paths:
-        if os.path.isdir(path):
-            for filetype in imsize.FILETYPES:
-                allfiles += glob.glob(os.path.join(path, filetype))
-                allfiles += glob.glob(os.path.join(path, filetype.upper()))
-        elif os.path.isfile(path):
-            allfiles += [path]
+    dircache = {} if dircache is None else dircache
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        listings = executor.map(functools.partial(_list_files, dircache=dircache), paths)
+        allfiles = list(itertools.chain.from_iterable(listings))
     return allfiles
 
 
-def scan_sizes(filespecs, verbose, show_all):
+def _list_files(path, dircache):
+    key = os.path.abspath(path)
+    if os.path.isdir(path):
+        try:
+            mtime = os.stat(path).st_mtime_ns  # changes when files are added, removed or renamed
+            cached = dircache.get(key)
+            if not _is_current(cached, mtime):
+                with os.scandir(path) as entries:  # one pass, case-insensitive, skipping hidden files like glob does
+                    names = [e.name for e in entries if e.is_file() and _suffix(e.name) in SUFFIXES and e.name[:1] != "."]
+                cached = {"mtime_ns": mtime, "version": imsize.__version__, "files": names}
+        except OSError:  # unreadable => skip
+            dircache.pop(key, None)
+            return []
+        if time.time_ns() - mtime < _RACY_NS:  # may change again within the same tick => unnoticed
+            dircache.pop(key, None)
+        elif cached.get("visited") != _today():
+            dircache[key] = {**cached, "visited": _today()}  # new dict, as the caller compares before & after
+        return [(os.path.join(path, name), name) for name in cached["files"]]
+    dircache.pop(key, None)  # deleted or not a directory
+    if os.path.isfile(path):
+        return [(path, os.path.basename(path))]
+    return []
+
+
+def _is_current(cached, mtime):
+    # A listing is reused only if the directory is unchanged and it was made
+    # by this version of imsize, as newer versions may support more filetypes;
+    # anything malformed, e.g., in a hand-edited cache file, is listed again
+    if not isinstance(cached, dict) or cached.get("mtime_ns") != mtime or cached.get("version") != imsize.__version__:
+        return False
+    files = cached.get("files")
+    return isinstance(files, list) and all(isinstance(name, str) for name in files)
+
+
+def prune_dircache(dircache):
+    """
+    Removes the directories that have not been scanned in DIRCACHE_MAX_AGE days
+    from the given dircache dict, including those that no longer exist.
+    """
+    oldest = _today() - DIRCACHE_MAX_AGE
+    for key in [key for key, cached in dircache.items() if not isinstance(cached, dict) or cached.get("visited", 0) < oldest]:
+        del dircache[key]
+
+
+def _today():
+    return int(time.time() // 86400)  # days since epoch; changes at most once a day
+
+
+def load_cache(filename):
     """
-    Displays the dimensions of the given list of images.
+    Loads the given JSON file from the cache directory. Returns an empty dict
+    if the file does not exist or cannot be parsed.
+    """
+    try:
+        with open(os.path.join(CACHE_DIR, filename), encoding="utf-8") as f:
+            cache = json.load(f)
+            return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(filename, cache):
+    """
+    Saves the given dict into the cache directory as a JSON file. Caching is
+    best-effort, so failures to write the file are silently ignored.
+    """
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        cachefile = os.path.join(CACHE_DIR, filename)
+        tmpfile = f"{cachefile}.{os.getpid()}"
+        with open(tmpfile, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+        os.replace(tmpfile, cachefile)  # atomic
+    except OSError:
+        pass
+
+
+def _suffix(filename):
+    return os.path.splitext(filename)[1].lower()  # "image.JPG" => ".jpg"
+
+
+def open_infocache():
+    """
+    Opens (or creates) the SQLite database that caches ImageInfo objects
+    across runs. Returns None if the database cannot be opened.
+    """
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        db = sqlite3.connect(os.path.join(CACHE_DIR, "info.db"))
+        with db:
+            if db.execute("PRAGMA user_version").fetchone()[0] != _INFOCACHE_SCHEMA:
+                db.execute("DROP TABLE IF EXISTS cache")  # just a cache, so no need to migrate
+                db.execute(f"PRAGMA user_version = {_INFOCACHE_SCHEMA}")
+            db.execute("CREATE TABLE IF NOT EXISTS cache "
+                       "(path BLOB, size INTEGER, mtime_ns INTEGER, version TEXT, fast INTEGER, info BLOB, visited INTEGER, "
+                       "PRIMARY KEY (path, fast))")
+            db.execute("CREATE INDEX IF NOT EXISTS cache_visited ON cache (visited)")
+    except (OSError, sqlite3.Error):
+        return None
+    else:
+        return db
+
+
+def scan_sizes(filespecs, verbose, show_all, infocache=None, fast=False):
+    """
+    Displays the dimensions of the given list of (filespec, basename) tuples
+    as returned by find_files(), sorting the list in place. If an infocache
+    database is given, unchanged files are looked up from there instead of
+    parsing them again, and newly parsed files are added to it. See read_all()
+    for the meaning of 'fast'.
     """
     total_compressed = 0
     total_uncompressed = 0
     num_processed = 0
-    for filespec in sorted(filespecs):
-        basename = os.path.basename(filespec)
-        try:
-            info = imsize.read(filespec)
-        except Exception as e:
-            print(f"{basename}: {type(e).__name__}: {e}")
+    if verbose or show_all:  # otherwise only the totals are shown
+        filespecs.sort()  # in place to avoid a second copy of a potentially huge list
+    paths = [filespec for filespec, _ in filespecs]
+    results = read_all(paths, fast) if infocache is None else read_all_cached(paths, infocache, fast)
+    lines = []
+    for filespec, basename in filespecs:
+        if len(lines) >= 1024:
+            _write_lines(lines)
+        info = results[filespec]
+        if isinstance(info, Exception):
+            lines.append(f"{basename}: {type(info).__name__}: {info}")
             continue
         if info.width is None:
-            print(f"{basename}: Unable to guess dimensions. Maybe not an image? Skipping.")
+            lines.append(f"{basename}: Unable to guess dimensions. Maybe not an image? Skipping.")
         else:
             num_processed += 1
-            total_uncompressed += info.nbytes / 1024**2
-            total_compressed += info.filesize / 1024**2
+            total_uncompressed += info.nbytes
+            total_compressed += info.filesize
             if verbose:
-                megs = info.nbytes / 1024**2
+                megs = info.nbytes / _MB
                 mpix = info.width * info.height / 1000000
                 est = " [estimated]" if info.uncertain else ""
                 if info.rot90_ccw_steps in [0, 2]:
                     width, height = (info.width, info.height)
                 else:
                     width, height = (info.height, info.width)
-                print(f"{basename}: {width} x {height} x {info.nchan} x {info.bitdepth} bits => {megs:.1f} MB{est}, {mpix:.1f} MP")
+                lines.append(f"{basename}: {width} x {height} x {info.nchan} x {info.bitdepth} bits => {megs:.1f} MB{est}, {mpix:.1f} MP")
             if show_all:
-                print(info)
+                lines.append(str(info))
+    _write_lines(lines)
+    total_compressed /= _MB
+    total_uncompressed /= _MB
     print(f"Scanned {num_processed} images, total {total_compressed:.1f} MB compressed, {total_uncompressed:.1f} MB uncompressed")
 
 
+def _write_lines(lines):
+    # one write() per batch of lines instead of one print() per line
+    if lines:
+        sys.stdout.write("\n".join(lines) + "\n")
+        lines.clear()
+
+
+def read_all(filespecs, fast=False):
+    """
+    Parses the headers of the given images in parallel, returning a dict that
+    maps each filespec to an ImageInfo, or to the Exception that was raised.
+    Header parsing is dominated by I/O latency, so keeping many reads in flight
+    is much faster than going through the files one by one. With fast=True,
+    nothing beyond the headers is read, at the cost of assuming that all
+    headerless camera raw files are 12-bit; see imsize.read().
+    """
+    infos = imsize.read_many(filespecs, max_workers=MAX_WORKERS, fast=fast)
+    return dict(zip(filespecs, infos))
+
+
+def read_all_cached(filespecs, db, fast=False):
+    """
+    Like read_all(), but looks up each file from the given infocache database
+    first, keyed by (path, size, mtime_ns, fast), and only parses the files that are
+    missing or have changed. The files are stat'ed in parallel and looked up
+    in batches. The new results are stored, and files not seen in the last
+    INFOCACHE_MAX_AGE days are dropped, in one transaction.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        keys = list(executor.map(functools.partial(_cache_key, fast=fast), filespecs))
+    rows = _cache_lookup(db, keys, fast)
+    today = _today()
+    results = {}
+    misses = {}
+    revisited = []
+    for filespec, key in zip(filespecs, keys):
+        blob, visited = rows.get(key, (None, None))
+        info = _unpickle(blob)
+        if info is None:
+            misses[filespec] = key
+        else:
+            info.filespec = filespec  # may have been cached under a different relative path
+            results[filespec] = info
+            if visited != today:
+                revisited.append((today, key[0], fast))
+    results.update(read_all(list(misses), fast))
+    new_rows = [(*key, pickle.dumps(results[filespec]), today) for filespec, key in misses.items()
+                if key is not None and not isinstance(results[filespec], Exception)]
+    try:
+        with db:  # single transaction
+            db.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?, ?)", new_rows)
+            db.executemany("UPDATE cache SET visited=? WHERE path=? AND fast=?", revisited)  # at most once a day per file
+            db.execute("DELETE FROM cache WHERE visited < ?", (today - INFOCACHE_MAX_AGE,))
+    except sqlite3.Error:
+        pass  # caching is best-effort
+    return results
+
+
+def _cache_key(filespec, fast):
+    try:
+        st = os.stat(filespec)
+    except OSError:
+        return None
+    else:
+        path = os.fsencode(os.path.abspath(filespec))  # bytes, as filenames need not be valid UTF-8
+        return (path, st.st_size, st.st_mtime_ns, imsize.__version__, int(fast))
+
+
+def _cache_lookup(db, keys, fast):
+    # Returns a dict that maps the given keys to their (info, visited) rows
+    # in the database, for those keys that are found; a row is only valid
+    # for the exact same (path, size, mtime_ns, version, fast)
+    paths = [key[0] for key in keys if key is not None]
+    rows = {}
+    try:
+        for i in range(0, len(paths), _SQL_BATCH):
+            batch = paths[i:i + _SQL_BATCH]
+            query = f"SELECT path, size, mtime_ns, version, fast, info, visited FROM cache WHERE fast=? AND path IN ({','.join('?' * len(batch))})"  # noqa: S608 -- only placeholders
+            rows.update((tuple(row[:5]), row[5:]) for row in db.execute(query, [int(fast), *batch]))
+    except sqlite3.Error:  # corrupted database
+        return {}
+    return rows
+
+
+def _unpickle(blob):
+    if blob is None:
+        return None
+    try:
+        return pickle.loads(blob)  # noqa: S301 -- written by us, in the user's own cache dir
+    except Exception:  # corrupted entry
+        return None
+
+
 if __name__ == "__main__":
     main()
@@ -3,7 +3,24 @@ A minimal header parser for OpenEXR images, meant solely for querying the
 dimensions and bit depth.
 """
 
-import numpy as np  # pip install numpy
+import os         # built-in library
+import struct     # built-in library
+import threading  # built-in library
+
+
+# EXR headers are almost always smaller than this, so a single read()
+# usually covers the whole header
+
+_CHUNK_SIZE = 65536
+
+# A reusable read buffer for each thread, so that scanning thousands of
+# files does not allocate a new 64 KB bytes object for every one of them
+
+_scratch = threading.local()
+
+_exr_header = struct.Struct("<4sI").unpack_from  # magic number, version
+_u32 = struct.Struct("<I").unpack_from
+_i32x4 = struct.Struct("<4i").unpack_from
 
 
 ######################################################################################
@@ -19,41 +36,25 @@ def dims(filespec, verbose=False):
     of the given EXR file.
     """
     with open(filespec, "rb") as f:
-        if f.read(4) == b"\x76\x2f\x31\x01":  # EXR magic number
-            version = np.frombuffer(f.read(4), dtype="<u4")[0]
-            max_strlen = 256 if (version & 0x400) else 32
-            got_channels = False
-            got_dims = False
-            while not (got_channels and got_dims):
-                attr_name = _read_string_nul(f, max_strlen)
-                _ = _read_string_nul(f, max_strlen)  # attr_type
-                attr_size = np.frombuffer(f.read(4), dtype="<u4")[0]
-                if attr_name == "channels":
-                    nchan = 0
-                    isfloat = False
-                    bitdepth = 16
-                    while not got_channels:
-                        name = _read_string_nul(f, max_strlen)
-                        if len(name) >= 1:
-                            dtype = np.frombuffer(f.read(16), dtype="<u4")[0]
-                            isfloat = isfloat or (dtype > 0)
-                            bitdepth = max(bitdepth, 16 if dtype == 1 else 32)
-                            nchan += 1
-                        else:
-                            got_channels = True
-                elif attr_name == "dataWindow":
-                    box = np.frombuffer(f.read(16), dtype="<i4")
-                    xmin, ymin, xmax, ymax = box
-                    width = xmax - xmin + 1
-                    height = ymax - ymin + 1
-                    got_dims = True
-                else:
-                    _ = f.seek(attr_size, 1)
-            if verbose:
-                print(f"Reading file {filespec} ", end='')
-                print(f"(w={width}, h={height}, c={nchan}, bitdepth={bitdepth})")
-            return width, height, nchan, isfloat, bitdepth
-    raise RuntimeError(f"File {filespec} is not a valid EXR file.")
+        return dims_from_file(f, filespec, verbose)
+
+
+def dims_from_file(f, filespec="", verbose=False):
+    """
+    Like dims(), but reads the header from the given open binary file, from
+    the start regardless of its current position, so that callers that
+    already have the file open need not open it again. The filespec is only
+    used in messages.
+    """
+    f.seek(0)
+    try:
+        w, h, nchan, isfloat, bitdepth = _parse_header(f, filespec)
+    except (EOFError, struct.error):  # truncated header
+        raise RuntimeError(f"File {os.fsdecode(filespec)} is not a valid EXR file.") from None
+    if verbose:
+        print(f"Reading file {os.fsdecode(filespec)} ", end='')
+        print(f"(w={w}, h={h}, c={nchan}, bitdepth={bitdepth})")
+    return w, h, nchan, isfloat, bitdepth
 
 
 ######################################################################################
@@ -63,11 +64,97 @@ def dims(filespec, verbose=False):
 ######################################################################################
 
 
-def _read_string_nul(f, maxlen):
-    cur = f.tell()
-    chunk = f.read(maxlen)
-    asbytes = chunk.split(b"\x00")[0]
-    string = asbytes.decode("utf-8")
-    cur += len(string) + 1
-    f.seek(cur)
-    return string
+def _parse_header(f, filespec):
+    # The header is parsed one attribute at a time from a buffer ('blob')
+    # holding the bytes most recently read from the file; 'pos' is where the
+    # next attribute starts in the blob. Only the 'channels' and 'dataWindow'
+    # attributes are needed, so any other attribute that does not fit in the
+    # blob is skipped over with seek() rather than read.
+    blob = _read_chunk(f)
+    magic, version = _exr_header(blob, 0)
+    if magic != b"\x76\x2f\x31\x01":
+        raise RuntimeError(f"File {os.fsdecode(filespec)} is not a valid EXR file.")
+    max_strlen = 256 if (version & 0x400) else 32
+    pos = 8
+    channels = None
+    window = None
+    while channels is None or window is None:
+        try:
+            attr_name, value_pos = _read_string_nul(blob, pos, max_strlen)
+            _, value_pos = _read_string_nul(blob, value_pos, max_strlen)  # attr_type
+            attr_size, = _u32(blob, value_pos)
+            value_pos += 4
+        except (EOFError, struct.error):  # attribute header continues beyond the blob
+            blob, pos = _refill(f, blob, pos, _CHUNK_SIZE, filespec)
+            continue
+        if not attr_name:  # end of header
+            raise RuntimeError(f"File {os.fsdecode(filespec)} is missing required EXR attributes.")
+        value_end = value_pos + attr_size
+        if value_end > len(blob):  # attribute value continues beyond the blob
+            if attr_name in (b"channels", b"dataWindow"):
+                blob, pos = _refill(f, blob, pos, value_end - pos, filespec)
+            else:
+                f.seek(value_end - len(blob), os.SEEK_CUR)
+                blob, pos = _read_chunk(f), 0
+            continue
+        if attr_name == b"channels":
+            channels = _parse_channels(blob, value_pos, value_end)
+        elif attr_name == b"dataWindow":
+            window = _i32x4(blob, value_pos)
+        pos = value_end
+    nchan, isfloat, bitdepth = channels
+    xmin, ymin, xmax, ymax = window
+    width = xmax - xmin + 1
+    height = ymax - ymin + 1
+    return width, height, nchan, isfloat, bitdepth
+
+
+def _refill(f, blob, pos, nbytes, filespec):
+    # Returns a new blob that starts from blob[pos] and is at least 'nbytes'
+    # long, or as long as the file allows; keeping only the unparsed tail and
+    # reading at least a full chunk at a time keeps the total cost linear
+    tail = bytes(blob[pos:])
+    more = f.read(max(nbytes - len(tail), _CHUNK_SIZE))
+    if not more:
+        raise RuntimeError(f"File {os.fsdecode(filespec)} has a truncated EXR header.")
+    return memoryview(tail + more), 0
+
+
+def _parse_channels(buf, start, end):
+    # The channel list is a sequence of NUL-terminated names, each followed
+    # by a 16-byte struct starting with the pixel type, and terminated by an
+    # empty name; the total size in bytes is known from the attribute header
+    nchan = 0
+    isfloat = False
+    bitdepth = 16
+    pos = start
+    while True:
+        nul = buf.obj.find(b"\x00", pos, end)
+        if nul < 0:
+            raise RuntimeError("Malformed channel list in EXR header.")
+        if nul == pos:  # empty name => end of list
+            return nchan, isfloat, bitdepth
+        dtype, = _u32(buf, nul + 1)  # 0 = uint, 1 = half, 2 = float
+        isfloat = isfloat or (dtype > 0)
+        bitdepth = max(bitdepth, 16 if dtype == 1 else 32)
+        nchan += 1
+        pos = nul + 17
+
+
+def _read_chunk(f):
+    buf = getattr(_scratch, "buf", None)
+    if buf is None:
+        buf = _scratch.buf = bytearray(_CHUNK_SIZE)
+    nbytes = f.readinto(buf)
+    return memoryview(buf)[:nbytes]
+
+
+def _read_string_nul(buf, pos, maxlen):
+    # Names are only compared against known ASCII attribute names, so they
+    # are returned as zero-copy memoryview slices without decoding
+    end = buf.obj.find(b"\x00", pos, min(pos + maxlen, len(buf)))
+    if end < 0 and pos + maxlen > len(buf):
+        raise EOFError
+    if end < 0:
+        raise RuntimeError("Unterminated string in EXR header.")
+    return buf[pos:end], end + 1
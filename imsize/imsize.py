@@ -10,27 +10,26 @@ https://github.com/toaarnio/imsize
 """
 
 import os              # built-in library
-import sys             # built-in library
 import math            # built-in library
 import struct          # built-in library
-import ast             # built-in library
-import pprint          # built-in library
+import re              # built-in library
+import mmap            # built-in library
 import contextlib      # built-in library
-import pyexiv2         # pip install pyexiv2
-import exiftool        # pip install pyexiftool
-import rawpy           # pip install rawpy
-import numpy as np     # pip install numpy
+import functools       # built-in library
+import concurrent.futures  # built-in library
 
 try:
     # package mode
     from imsize import pnmhdr   # local import: pnmhdr.py
     from imsize import pfmhdr   # local import: pfmhdr.py
     from imsize import exrhdr   # local import: exrhdr.py
+    from imsize import tiffhdr  # local import: tiffhdr.py
 except ImportError:
     # stand-alone mode
     import pnmhdr
     import pfmhdr
     import exrhdr
+    import tiffhdr
 
 
 ######################################################################################
@@ -74,6 +73,12 @@ class ImageInfo:
       rot90_ccw_steps (int): Number of rotations to bring the image upright: 0 to 3
       uncertain (bool): True if width/height/bitdepth are uncertain
     """
+    # the order of __slots__ is the order of attributes in str() and repr()
+    __slots__ = ("filespec", "filetype", "filesize", "multi_picture", "num_images",  # noqa: RUF023
+                 "image_sizes", "image_offsets", "header_size", "isfloat", "cfa_raw",
+                 "width", "height", "nchan", "bitdepth", "bytedepth", "maxval", "nbytes",
+                 "orientation", "rot90_ccw_steps", "uncertain")
+
     def __init__(self):
         self.filespec = None
         self.filetype = None
@@ -97,76 +102,78 @@ class ImageInfo:
         self.uncertain = None
 
     def __repr__(self):
-        reprstr = f"<ImageInfo {self.__dict__}>"
+        attrs = {name: getattr(self, name) for name in self.__slots__}
+        reprstr = f"<ImageInfo {attrs}>"
         return reprstr
 
     def __str__(self):
-        infostr = pprint.pformat(self.__dict__, sort_dicts=False)
+        attrs = (f"{name!r}: {getattr(self, name)!r}" for name in self.__slots__)
+        infostr = "{" + ",\n ".join(attrs) + "}"
         return infostr
 
 
-def read(filespec):
+def read(filespec, fast=False):
     """
     Parses a lowest common denominator set of metadata from the given
     image, i.e., the dimensions and bit depth. Does not read the entire
     file but only what's necessary. If the file type is recognized and
     parsing succeeds, returns an ImageInfo with all fields filled in.
     Otherwise, an exception is raised or only the basic file attributes
-    (name, type, size) are filled in.
+    (name, type, size) are filled in. The file type is detected from the
+    magic number at the start of the file, if any, or else from the file
+    extension. Results are cached by file identity, size, and modification
+    time, so reading an unchanged file again is nearly free. The filespec
+    may be a str, bytes, or path-like object, and is passed to the OS as is.
+
+    With fast=True, nothing beyond the header is read even if that leaves
+    some fields uncertain: the bit depth of a headerless camera raw file is
+    then assumed to be 12 instead of estimated from its pixels. This is the
+    recommended mode for scanning large directories.
 
     Example:
       info = imsize.read("myfile.jpg")
       factor = info.nbytes / info.filesize
       print(f"{info.filespec}: compression factor = {factor.1f}")
     """
-    filename = os.path.basename(filespec)             # "path/image.ext" => "image.ext"
-    extension = os.path.splitext(filename)[-1]        # "image.ext" => ".ext"
-    filetype = extension.lower()[1:]                  # ".EXT" => "ext"
-    handlers = {"png": _read_png,
-                "pnm": _read_pnm,
-                "pgm": _read_pnm,
-                "ppm": _read_pnm,
-                "pfm": _read_pfm,
-                "bmp": _read_bmp,
-                "jpeg": _read_jpeg,
-                "jpg": _read_jpeg,
-                "insp": _read_insp,
-                "tiff": _read_tiff,
-                "tif": _read_tiff,
-                "exr": _read_exr,
-                "hdr": _read_hdr,
-                "dng": _read_dng,
-                "cr2": _read_cr2,
-                "nef": _read_nef,
-                "raw": _read_raw,
-                "npy": _read_npy}
-
-    # Check that we have a parser for each known filetype, and
-    # conversely, that all filetypes are listed for which we have
-    # a parser
-
-    filetypes = {ext[1:] for ext in FILETYPES}  # .ext => ext
-    assert set(handlers) == filetypes, set(handlers) ^ filetypes
-
-    if filetype in handlers:
-        handler = handlers[filetype]
-        try:
-            info = handler(filespec)
-        except ImageFileError:
-            raise
-        except Exception as e:
-            raise ImageFileError(f"File {filespec} is not a recognized {filetype.upper()} file.") from e
-        else:
-            return info
-    else:
-        # unrecognized file extension
-        info = ImageInfo()
-        info.filespec = filespec
-        info.filetype = filetype
-        info.filesize = os.path.getsize(filespec)
-        info.nbytes = info.filesize
-        info.uncertain = True
-        return info
+    try:
+        st = os.stat(filespec)
+    except OSError as e:
+        raise ImageFileError(f"File {os.fsdecode(filespec)} cannot be read.") from e
+    info = _read_cached(filespec, fast, st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+    return _copy(info)
+
+
+def read_many(filespecs, max_workers=None, fast=False):
+    """
+    Like read(), but for a batch of files. Returns a list with one entry per
+    filespec, in the same order. Files that cannot be parsed are represented
+    by the ImageFileError that read() would have raised, so that one broken
+    file does not abort the whole batch. The files are read in a pool of
+    max_workers threads, because parsing headers is dominated by I/O latency
+    rather than CPU; max_workers=1 reads them one by one in the caller's
+    thread. See read() for the meaning of 'fast'.
+
+    Example:
+      infos = imsize.read_many(["image1.jpg", "image2.png"])
+      valid = [info for info in infos if isinstance(info, imsize.ImageInfo)]
+    """
+    filespecs = list(filespecs)
+    max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
+    reader = functools.partial(_read_or_error, fast=fast)
+    if max_workers == 1 or len(filespecs) <= 1:
+        return [reader(filespec) for filespec in filespecs]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(reader, filespecs))
+
+
+def clear_cache():
+    """
+    Empties the cache of previously parsed files, e.g., to release memory.
+    Modified files are detected and re-parsed automatically, so there is no
+    need to call this for correctness, except when a file gets overwritten
+    within the timestamp resolution of the file system.
+    """
+    _read_cached.cache_clear()
 
 
 class ImageFileError(Exception):
@@ -182,48 +189,182 @@ class ImageFileError(Exception):
 ######################################################################################
 
 
-@contextlib.contextmanager
-def silence_stdout():
-    stdout_fd = sys.stdout.fileno()
-    orig_fd = os.dup(stdout_fd)
-    null_fd = os.open(os.devnull, os.O_WRONLY)
-    os.dup2(null_fd, stdout_fd)
+@functools.lru_cache(maxsize=16384)
+def _read_cached(filespec, fast, _dev, _ino, filesize, _mtime_ns):
+    filename = os.path.basename(os.fsdecode(filespec))  # "path/image.ext" => "image.ext"
+    extension = os.path.splitext(filename)[-1]          # "image.ext" => ".ext"
+    filetype = extension.lower()[1:]                    # ".EXT" => "ext"
+
+    # Trust the magic number over the extension of image files, except for
+    # headerless camera raw files, which have no magic number to begin with;
+    # files with no extension are recognized by the magic number alone, and
+    # files with any other extension (e.g., "notes.txt") are not images, so
+    # there is no point in probing those two
+
+    if filetype == "raw" or (filetype and filetype not in _HANDLERS):
+        return _parse(filespec, filesize, filetype, fast)
     try:
-        yield
-    finally:
-        os.dup2(orig_fd, stdout_fd)
-        os.close(orig_fd)
-        os.close(null_fd)
+        with open(filespec, "rb", buffering=0) as f:  # unbuffered: read only what we ask for
+            return _parse(filespec, filesize, filetype, fast, f)
+    except OSError as e:  # parse errors are ImageFileErrors by now
+        raise ImageFileError(f"File {os.fsdecode(filespec)} cannot be read.") from e
+
+
+def _parse(filespec, filesize, filetype, fast, f=None):
+    # Parses the given file as the given type, or if it is open as 'f', as
+    # the type indicated by its magic number; the probed head and the file
+    # are then passed on to the handlers that can use them, to save opening
+    # and reading the file again
+    head = None
+    magic_types = ()
+    if f is not None:
+        head = _read_head(f)
+        magic_types = _detect(head)
+    guessed = False
+    if magic_types and filetype not in magic_types:
+        guessed = not filetype  # extensionless => may just look like an image
+        filetype = magic_types[0]  # misnamed or extensionless file
+
+    handler = _HANDLERS.get(filetype)
+    if fast:
+        handler = _FAST_HANDLERS.get(filetype, handler)
+    if handler is not None:
+        try:
+            info = handler(filespec, filesize, *_extra_args(handler, head, f))
+        except ImageFileError:
+            if not guessed:
+                raise
+        except Exception as e:
+            if not guessed:
+                raise ImageFileError(f"File {os.fsdecode(filespec)} is not a recognized {filetype.upper()} file.") from e
+        else:
+            return info
+
+    # unrecognized file extension, or an extensionless file that turned out
+    # not to be an image after all
+    info = ImageInfo()
+    info.filespec = filespec
+    info.filetype = "" if guessed else filetype
+    info.filesize = filesize
+    info.nbytes = info.filesize
+    info.uncertain = True
+    return info
 
 
-def _read_png(filespec):
+def _extra_args(handler, head, f):
+    # the probed head or the open file, for the handlers that can take them
+    if handler in _HEAD_HANDLERS:
+        return (head,)
+    if handler in _FILE_HANDLERS:
+        return (f,)
+    return ()
+
+
+def _read_or_error(filespec, fast=False):
+    try:
+        return read(filespec, fast)
+    except ImageFileError as e:
+        return e
+
+
+def _copy(info):
+    # Return a copy of the cached ImageInfo, so that nobody can modify the
+    # cached instance; the lists are the only mutable attributes
+    result = ImageInfo.__new__(ImageInfo)
+    for name in ImageInfo.__slots__:
+        setattr(result, name, getattr(info, name))
+    if info.image_sizes is not None:
+        result.image_sizes = list(info.image_sizes)
+        result.image_offsets = list(info.image_offsets)
+    return result
+
+
+# Magic numbers of the file types that can be recognized from the first
+# few bytes, mapped to all the file types sharing the same container format
+
+_MAGIC = {b"\xff\xd8": ("jpeg", "jpg", "insp"),
+          b"\x89PNG\r\n\x1a\n": ("png",),
+          b"\x76\x2f\x31\x01": ("exr",),
+          b"II*\x00": ("tiff", "tif", "dng", "cr2", "nef"),
+          b"MM\x00*": ("tiff", "tif", "dng", "cr2", "nef"),
+          b"P5": ("pgm", "pnm", "ppm"),
+          b"P6": ("ppm", "pnm", "pgm"),
+          b"PF": ("pfm",),
+          b"Pf": ("pfm",),
+          b"#?RADIANCE\n": ("hdr",),
+          b"\x93NUMPY": ("npy",),
+          b"BM": ("bmp",)}
+
+# Magic numbers bucketed by their first byte, so that detecting the file
+# type takes a dict lookup and typically just one startswith()
+
+_MAGIC_BY_FIRST_BYTE = {first: [(magic, ft) for magic, ft in _MAGIC.items() if magic[:1] == first]
+                        for first in {magic[:1] for magic in _MAGIC}}
+
+
+_HEADER_SIZE = 65536  # enough for the header of all supported formats, practically
+_PROBE_SIZE = 4096  # one page: the entire header of PNG, BMP, PNM, PFM, NPY, and most HDRs
+
+
+def _probe(filespec):
+    with open(filespec, "rb", buffering=0) as f:  # unbuffered: read only what we ask for
+        return _read_head(f)
+
+
+def _read_head(f):
+    if hasattr(os, "posix_fadvise"):  # not available on macOS & Windows
+        # Kick off readahead of the header region, as parsers that need
+        # more than the probed head are going to read it next; this is
+        # just a hint, so ignore failures
+        with contextlib.suppress(OSError):
+            os.posix_fadvise(f.fileno(), 0, _HEADER_SIZE, os.POSIX_FADV_WILLNEED)
+    head = f.read(_PROBE_SIZE)
+    return head
+
+
+def _detect(header):
+    for magic, filetypes in _MAGIC_BY_FIRST_BYTE.get(header[:1], []):
+        if header.startswith(magic):
+            return filetypes
+    return ()
+
+
+_PNG_SIG = b"\x89PNG\r\n\x1a\n"
+_PNG_IHDR = struct.Struct(">LLBB")  # width, height, bitdepth, colortype
+_PNG_CTYPE_TO_NCHAN = {0: 1,  # greyscale => 1 channel
+                       2: 3,  # truecolor => 3 channels
+                       3: 3,  # indexed => 3 channels
+                       4: 2,  # greyscale_alpha => 2 channels
+                       6: 4}  # truecolor_alpha => 4 channels
+
+
+def _read_png(filespec, filesize=None, head=None):
+    header = _probe(filespec) if head is None else head
+    if not header.startswith(_PNG_SIG) or header[12:16] != b"IHDR":  # IHDR must come first
+        raise ImageFileError(f"File {os.fsdecode(filespec)} is not a valid PNG file.")
+    ihdr = _PNG_IHDR.unpack_from(header, 16)
     info = ImageInfo()
     info.filespec = filespec
+    info.filesize = filesize
     info.filetype = "png"
     info.isfloat = False
     info.cfa_raw = False
-    with open(filespec, "rb") as f:
-        header = f.read(26)
-        signature = bytes([0x89, 0x50, 0x4e, 0x47, 0x0d, 0x0a, 0x1a, 0x0a])
-        if header.startswith(signature) and header[12:16] == b"IHDR":
-            ihdr = struct.unpack(">LLBB", header[16:26])
-            info.width = ihdr[0]
-            info.height = ihdr[1]
-            info.bitdepth = ihdr[2]
-            info.nchan = {0: 1,           # greyscale => 1 channel
-                          2: 3,           # truecolor => 3 channels
-                          3: 3,           # indexed => 3 channels
-                          4: 2,           # greyscale_alpha => 2 channels
-                          6: 4}[ihdr[3]]  # truecolor_alpha => 4 channels
-            info = _complete(info)
-            return info
-    raise ImageFileError(f"File {filespec} is not a valid PNG file.")
+    info.width = ihdr[0]
+    info.height = ihdr[1]
+    info.bitdepth = ihdr[2]
+    info.maxval = (1 << info.bitdepth) - 1
+    info.bytedepth = 2 if info.bitdepth > 8 else 1
+    info.nchan = _PNG_CTYPE_TO_NCHAN[ihdr[3]]
+    info = _complete(info)
+    return info
 
 
-def _read_pnm(filespec):
+def _read_pnm(filespec, filesize=None, head=None):
     info = ImageInfo()
-    shape, maxval = pnmhdr.dims(filespec)
+    head = _probe(filespec) if head is None else head
+    shape, maxval = pnmhdr.dims_from_buffer(head, filespec)
     info.filespec = filespec
+    info.filesize = filesize
     info.filetype = "pnm"
     info.isfloat = False
     info.cfa_raw = False
@@ -235,10 +376,12 @@ def _read_pnm(filespec):
     return info
 
 
-def _read_pfm(filespec):
+def _read_pfm(filespec, filesize=None, head=None):
     info = ImageInfo()
-    shape, maxval = pfmhdr.dims(filespec)
+    head = _probe(filespec) if head is None else head
+    shape, maxval = pfmhdr.dims_from_buffer(head, filespec)
     info.filespec = filespec
+    info.filesize = filesize
     info.filetype = "pfm"
     info.isfloat = True
     info.cfa_raw = False
@@ -252,65 +395,76 @@ def _read_pfm(filespec):
     return info
 
 
-def _read_hdr(filespec):
+def _read_hdr(filespec, filesize=None, head=None):
     info = ImageInfo()
     info.filespec = filespec
+    info.filesize = filesize or os.path.getsize(filespec)
     info.filetype = "hdr"
-    info.filesize = os.path.getsize(filespec)
     info.isfloat = True
     info.cfa_raw = False
     info.nchan = 3
     info.bitdepth = 32
     info.bytedepth = 4
-    with open(filespec, "rb") as f:
-        if f.readline() != b"#?RADIANCE\n":
-            raise ImageFileError(f"File {filespec} is not a valid Radiance HDR file.")
-        for line in f:
-            if line == b"\n":
-                dims = f.readline().decode("utf-8")  # '-Y 480 +X 720'
-                dims = dims.split(" ")
-                info.height = int(dims[1])
-                info.width = int(dims[3])
-                info = _complete(info)
-                return info
-    raise ImageFileError(f"File {filespec} is not a valid Radiance HDR file.")
-
-
-def _read_bmp(filespec):
+    header = _probe(filespec) if head is None else head  # typically less than 1 KB
+    end = header.find(b"\n\n")  # blank line terminates the header
+    if len(header) == _PROBE_SIZE and (end < 0 or header.find(b"\n", end + 2) < 0):  # resolution line cut off
+        with open(filespec, "rb", buffering=0) as f:
+            f.seek(_PROBE_SIZE)
+            header += f.read(_HEADER_SIZE)
+        end = header.find(b"\n\n")
+    if header.startswith(b"#?RADIANCE\n"):
+        dims = header[end + 2:].split(b"\n", 1)  # '-Y 480 +X 720'
+        if end > 0 and len(dims) == 2:
+            dims = dims[0].decode("utf-8").split(" ")
+            info.height = int(dims[1])
+            info.width = int(dims[3])
+            info = _complete(info)
+            return info
+    raise ImageFileError(f"File {os.fsdecode(filespec)} is not a valid Radiance HDR file.")
+
+
+_BMP_DIB_SIZE = struct.Struct("<I")
+_BMP_CORE_HEADER = struct.Struct("<HHHH")  # width, height, planes, bpp
+_BMP_INFO_HEADER = struct.Struct("<iiHH")  # width, height, planes, bpp
+_BMP_BPP_TO_NCHAN = {1: 1,   # 1 bpp => 1 channel
+                     2: 3,   # 2 bpp palettized => 3 channels
+                     4: 3,   # 4 bpp palettized => 3 channels
+                     8: 3,   # 8 bpp palettized => 3 channels
+                     16: 4,  # 16 bpp RGBA => 4 channels
+                     24: 3,  # 24 bpp RGB => 3 channels
+                     32: 4}  # 32 bpp RGBA => 4 channels
+
+
+def _read_bmp(filespec, filesize=None, head=None):
     info = ImageInfo()
     info.filespec = filespec
+    info.filesize = filesize
     info.filetype = "bmp"
     info.isfloat = False
     info.cfa_raw = False
-    with open(filespec, "rb") as f:
-        bmp_header = f.read(14)
-        if bmp_header[:2] == b"BM":
-            dib_header_size = np.fromfile(f, dtype=np.uint32, count=1)
-            fmt = "<HHHH" if dib_header_size == 12 else "<iiHH"
-            dib_header = struct.unpack(fmt, f.read(struct.calcsize(fmt)))
-            info.width = dib_header[0]
-            info.height = abs(dib_header[1])  # negative => top to bottom
-            bpp = dib_header[3]
-            info.nchan = {1: 1,        # 1 bpp => 1 channel
-                          2: 3,        # 2 bpp palettized => 3 channels
-                          4: 3,        # 4 bpp palettized => 3 channels
-                          8: 3,        # 8 bpp palettized => 3 channels
-                          16: 4,       # 16 bpp RGBA => 4 channels
-                          24: 3,       # 24 bpp RGB => 3 channels
-                          32: 4}[bpp]  # 32 bpp RGBA => 4 channels
-            info.maxval = 255
-            info = _complete(info)
-            return info
-    raise ImageFileError(f"File {filespec} is not a valid BMP file.")
+    bmp_header = _probe(filespec) if head is None else head  # file header + DIB header
+    if bmp_header[:2] == b"BM":
+        dib_header_size, = _BMP_DIB_SIZE.unpack_from(bmp_header, 14)
+        fmt = _BMP_CORE_HEADER if dib_header_size == 12 else _BMP_INFO_HEADER
+        dib_header = fmt.unpack_from(bmp_header, 18)
+        info.width = dib_header[0]
+        info.height = abs(dib_header[1])  # negative => top to bottom
+        bpp = dib_header[3]
+        info.nchan = _BMP_BPP_TO_NCHAN[bpp]
+        info.maxval = 255
+        info = _complete(info)
+        return info
+    raise ImageFileError(f"File {os.fsdecode(filespec)} is not a valid BMP file.")
 
 
-def _read_exr(filespec):
+def _read_exr(filespec, filesize=None, f=None):
     info = ImageInfo()
     info.filespec = filespec
+    info.filesize = filesize
     info.filetype = "exr"
     info.cfa_raw = False
     info.maxval = 1.0
-    w, h, nchan, isfloat, bitdepth = exrhdr.dims(filespec)
+    w, h, nchan, isfloat, bitdepth = exrhdr.dims(filespec) if f is None else exrhdr.dims_from_file(f, filespec)
     info.width = w
     info.height = h
     info.nchan = nchan
@@ -321,98 +475,124 @@ def _read_exr(filespec):
     return info
 
 
-def _read_jpeg(filespec):
-    info = _read_exif_pyexiv2(filespec)
-    if info is not None:
-        info.filespec = filespec
-        info.filetype = "jpeg"
-        info.isfloat = False
-        info.cfa_raw = False
-        with open(filespec, "rb") as f:
-            if f.read(2) == b"\xff\xd8":
-                size = 2
-                segtype = 0
-                while not 0xc0 <= segtype <= 0xcf or segtype in [0xc4, 0xc8, 0xcc]:
-                    f.seek(size - 2, 1)  # skip to next segment
-                    _0xff, segtype, size = struct.unpack(">BBH", f.read(4))
-                    if segtype == 0xe2:  # APP2
-                        prev_pos = f.tell()
-                        # Detect Multi-Picture Format (MPF) as per CIPA DC-007-2009
-                        if f.read(4) == b"MPF\x00":
-                            endianness = f.read(4)
-                            bo = ">" if endianness == b"MM\x00*" else "<"
-                            offset, count = struct.unpack(f"{bo}IH", f.read(6))
-                            version_tag, version = struct.unpack(f"{bo}Hxxxxxx4s", f.read(12))
-                            nimages_tag, nimages = struct.unpack(f"{bo}HxxxxxxI", f.read(12))
-                            mpentry_tag, = struct.unpack(f"{bo}Hxxxxxxxxxx", f.read(12))
-                            next_ifd, = struct.unpack(f"{bo}I", f.read(4))
-                            prefix = f"Error parsing MPF JPEG '{filespec}':"
-                            assert offset == 8, f"{prefix}: Expected offset 8, got {offset}"
-                            assert count == 3, f"{prefix}: Expected count 3, got {count}"
-                            assert version_tag == 45056, f"{prefix}: Expected tag id 45056 (MPFVersion), got {version_tag}"
-                            assert version == b"0100", f"{prefix}: Expected version '0100', got {version}"
-                            assert nimages_tag == 45057, f"{prefix}: Expected tag id 45057 (NumberOfImages), got {nimages_tag}"
-                            assert nimages in [2, 3], f"{prefix}: Expected 2 or 3 sub-images, got {nimages}"
-                            assert mpentry_tag == 45058, f"{prefix}: Expected tag id 45058 (MPEntry), got {mpentry_tag}"
-                            info.multi_picture = True
-                            info.num_images = nimages
-                            info.image_sizes = []
-                            info.image_offsets = []
-                            for _ in range(info.num_images):
-                                _attrs, imsize, offset, _entry1, _entry2 = struct.unpack(f"{bo}IIIHH", f.read(16))
-                                info.image_offsets.append(offset + prev_pos + 4)
-                                info.image_sizes.append(imsize)
-                        f.seek(prev_pos)
-                sof = struct.unpack(">BHHB", f.read(6))
-                info.bitdepth = sof[0]
-                info.height = sof[1]
-                info.width = sof[2]
-                info.nchan = sof[3]
-                info = _complete(info)
-                return info
-    raise ImageFileError(f"File {filespec} is not a valid JPEG file.")
-
-
-def _read_insp(filespec):
-    info = _read_jpeg(filespec)
+_JPEG_SEGMENT = struct.Struct(">BBH")  # 0xff, segtype, size
+_JPEG_SOF = struct.Struct(">BHHB")  # bitdepth, height, width, nchan
+
+# Start Of Frame markers, indexed by segment type: 0xc0..0xcf, except
+# DHT (0xc4), JPG (0xc8), and DAC (0xcc), which share the same range
+
+_IS_SOF = bytes(0xc0 <= segtype <= 0xcf and segtype not in (0xc4, 0xc8, 0xcc) for segtype in range(256))
+
+
+@functools.lru_cache(maxsize=2)
+def _mpf_structs(bo):
+    return (struct.Struct(f"{bo}IH"),            # offset, count
+            struct.Struct(f"{bo}Hxxxxxx4s"),     # MPFVersion
+            struct.Struct(f"{bo}HxxxxxxI"),      # NumberOfImages
+            struct.Struct(f"{bo}Hxxxxxxxxxx"),   # MPEntry
+            struct.Struct(f"{bo}IIIHH"))         # MP entry: attrs, size, offset, ...
+
+
+def _read_jpeg(filespec, filesize=None, f=None):
+    if f is None:
+        with open(filespec, "rb") as jpegfile:
+            return _read_jpeg(filespec, filesize, jpegfile)
+    info = ImageInfo()
+    info.filespec = filespec
+    info.filesize = filesize
+    info.filetype = "jpeg"
+    info.isfloat = False
+    info.cfa_raw = False
+    exif_offset = None
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if mm[:2] != b"\xff\xd8":
+            raise ImageFileError(f"File {os.fsdecode(filespec)} is not a valid JPEG file.")
+        pos = 2
+        size = 2
+        segtype = 0
+        while not _IS_SOF[segtype]:
+            pos += size - 2  # skip to next segment
+            _0xff, segtype, size = _JPEG_SEGMENT.unpack_from(mm, pos)
+            pos += 4
+            if segtype == 0xe1 and mm[pos:pos + 6] == b"Exif\x00\x00":  # APP1
+                exif_offset = pos + 6  # TIFF header follows
+            if segtype == 0xe2 and mm[pos:pos + 4] == b"MPF\x00":  # APP2, Multi-Picture Format
+                _parse_mpf(mm, pos, filespec, info)
+        sof = _JPEG_SOF.unpack_from(mm, pos)
+        info.bitdepth = sof[0]
+        info.maxval = (1 << info.bitdepth) - 1
+        info.bytedepth = 2 if info.bitdepth > 8 else 1
+        info.height = sof[1]
+        info.width = sof[2]
+        info.nchan = sof[3]
+        if exif_offset is not None:
+            _parse_app1(mm, exif_offset, filespec, info)
+    info = _complete(info)
+    return info
+
+
+def _parse_app1(mm, offset, filespec, info):
+    # EXIF orientation from IFD0 of the TIFF header at the given offset
+    with contextlib.suppress(RuntimeError):  # malformed EXIF => orientation unknown
+        ifd0 = tiffhdr.parse(mm, offset, filespec)[0]
+        info.orientation = ifd0.get("orientation", (0,))[0]
+
+
+def _parse_mpf(mm, pos, filespec, info):
+    # Multi-Picture Format (MPF) as per CIPA DC-007-2009; pos is the start of
+    # the APP2 payload, that is, the "MPF\x00" identifier
+    bo = ">" if mm[pos + 4:pos + 8] == b"MM\x00*" else "<"
+    header, version_field, nimages_field, mpentry_field, mpentry = _mpf_structs(bo)
+    offset, count = header.unpack_from(mm, pos + 8)
+    version_tag, version = version_field.unpack_from(mm, pos + 14)
+    nimages_tag, nimages = nimages_field.unpack_from(mm, pos + 26)
+    mpentry_tag, = mpentry_field.unpack_from(mm, pos + 38)
+    prefix = f"Error parsing MPF JPEG '{os.fsdecode(filespec)}':"
+    assert offset == 8, f"{prefix}: Expected offset 8, got {offset}"
+    assert count == 3, f"{prefix}: Expected count 3, got {count}"
+    assert version_tag == 45056, f"{prefix}: Expected tag id 45056 (MPFVersion), got {version_tag}"
+    assert version == b"0100", f"{prefix}: Expected version '0100', got {version}"
+    assert nimages_tag == 45057, f"{prefix}: Expected tag id 45057 (NumberOfImages), got {nimages_tag}"
+    assert nimages in [2, 3], f"{prefix}: Expected 2 or 3 sub-images, got {nimages}"
+    assert mpentry_tag == 45058, f"{prefix}: Expected tag id 45058 (MPEntry), got {mpentry_tag}"
+    info.multi_picture = True
+    info.num_images = nimages
+    info.image_sizes = []
+    info.image_offsets = []
+    for i in range(info.num_images):  # MP entries follow the next IFD offset
+        entry = mpentry.unpack_from(mm, pos + 54 + 16 * i)
+        _attrs, imsize, offset, _entry1, _entry2 = entry
+        info.image_offsets.append(offset + pos + 4)
+        info.image_sizes.append(imsize)
+
+
+def _read_insp(filespec, filesize=None, f=None):
+    info = _read_jpeg(filespec, filesize, f)
     info.filetype = "insp"
     return info
 
 
-def _rot90_steps(exif_orientation):
-    exif_to_rot90 = {1: 0, 2: 0, 3: 2, 4: 0, 5: 1, 6: 3, 7: 3, 8: 1}
-    rot90_ccw_steps = exif_to_rot90.get(exif_orientation, None)
-    return rot90_ccw_steps
+def _tiff_ifds(filespec, f=None):
+    # IFD0 & SubIFDs, through the given open file if any
+    return tiffhdr.ifds(filespec) if f is None else tiffhdr.ifds_from_file(f, filespec)
 
 
-def _read_exif_pyexiv2(filespec):
+def _read_exif_tiffhdr(filespec, f=None):
     try:
-        with silence_stdout(), pyexiv2.Image(str(filespec)) as img:
-            encodings = ["utf-8", "ISO-8859-1"]
-            for encoding in encodings:
-                try:
-                    exif = img.read_exif(encoding)
-                except UnicodeDecodeError:
-                    continue
-        subimages = ["Image", "SubImage1", "SubImage2", "SubImage3"]
-        widths = [exif.get(f"Exif.{sub}.ImageWidth") for sub in subimages]
-        widths = [int(w or 0) for w in widths]  # None => 0
-        maximg = subimages[np.argmax(widths)]  # use the largest sub-image
-        info = ImageInfo()
-        info.cfa_raw = exif.get(f"Exif.{maximg}.PhotometricInterpretation") in ['32803', '34892']
-        info.width = int(exif.get(f"Exif.{maximg}.ImageWidth", 0))
-        info.height = int(exif.get(f"Exif.{maximg}.ImageLength", 0))
-        info.nchan = int(exif.get(f"Exif.{maximg}.SamplesPerPixel", 0))
-        info.bitdepth = exif.get(f"Exif.{maximg}.BitsPerSample", "0")
-        info.orientation = int(exif.get(f"Exif.{maximg}.Orientation", 0))
-        info.rot90_ccw_steps = _rot90_steps(info.orientation)
-        if isinstance(info.bitdepth, str):
-            bitdepths = tuple(int(el) for el in info.bitdepth.split(" "))  # string => tuple of ints
-            info.bitdepth = bitdepths[0]
+        ifds = _tiff_ifds(filespec, f)
     except RuntimeError:
         return None
-    else:
-        return info
+    maximg = max(ifds, key=lambda ifd: ifd.get("width", (0,))[0])  # use the largest sub-image
+    if "width" not in maximg or "height" not in maximg:
+        return None
+    info = ImageInfo()
+    info.cfa_raw = maximg.get("photometric", (0,))[0] in [32803, 34892]
+    info.width = maximg["width"][0]
+    info.height = maximg["height"][0]
+    info.nchan = maximg.get("nchan", (1,))[0]  # default as per TIFF 6.0
+    info.bitdepth = maximg.get("bitdepth", (1,))[0]  # default as per TIFF 6.0
+    info.orientation = maximg.get("orientation", (0,))[0]
+    return info
 
 
 def _multikey(meta, *keys):
@@ -423,8 +603,9 @@ def _multikey(meta, *keys):
 
 
 def _read_exif_exiftool(filespec):
+    import exiftool  # pip install pyexiftool; imported on first use  # noqa: PLC0415
     with exiftool.ExifToolHelper() as et:
-        meta = et.get_metadata(filespec)[0]
+        meta = et.get_metadata(os.fsdecode(filespec))[0]  # pyexiftool takes str paths only
         info = ImageInfo()
         info.cfa_raw = meta["EXIF:PhotometricInterpretation"] in [32803, 34892]
         info.width = _multikey(meta, "EXIF:ExifImageWidth", "XMP:ImageWidth", "EXIF:ImageWidth")
@@ -432,38 +613,41 @@ def _read_exif_exiftool(filespec):
         info.nchan = meta["EXIF:SamplesPerPixel"]
         info.bitdepth = meta["EXIF:BitsPerSample"]
         info.orientation = meta["EXIF:Orientation"]
-        info.rot90_ccw_steps = _rot90_steps(info.orientation)
         if isinstance(info.bitdepth, str):
-            bitdepths = tuple(int(el) for el in info.bitdepth.split(" "))  # string => tuple of ints
-            info.bitdepth = bitdepths[0]
+            info.bitdepth = int(info.bitdepth.partition(" ")[0])  # "16 16 16" => 16
         return info
 
 
-def _read_tiff(filespec):
-    info = _read_exif_pyexiv2(filespec)
+def _read_tiff(filespec, filesize=None, f=None):
+    info = _read_exif_tiffhdr(filespec, f)
     if info is None:
         info = _read_exif_exiftool(filespec)
     info.filespec = filespec
+    info.filesize = filesize
     info.filetype = "tiff"
     info.isfloat = False
     info = _complete(info)
     return info
 
 
-def _read_dng(filespec):
-    info = _read_exif_pyexiv2(filespec)
+def _read_dng(filespec, filesize=None, f=None):
+    info = _read_exif_tiffhdr(filespec, f)
     if info is None:
         info = _read_exif_exiftool(filespec)
     info.filespec = filespec
+    info.filesize = filesize
     info.filetype = "dng"
     info.isfloat = False
     info = _complete(info)
     return info
 
 
-def _read_cr2(filespec):
-    info = _read_exif_exiftool(filespec)
+def _read_cr2(filespec, filesize=None, f=None):
+    info = _read_exif_tiffhdr(filespec, f)  # IFD0 holds the full-size JPEG preview
+    if info is None:
+        info = _read_exif_exiftool(filespec)
     info.filespec = filespec
+    info.filesize = filesize
     info.filetype = "cr2"
     info.uncertain = True
     info.isfloat = False
@@ -475,27 +659,28 @@ def _read_cr2(filespec):
     return info
 
 
-def _read_nef(filespec):  # reading the whole file ==> SLOW
-    raw = rawpy.imread(filespec)
-    raw = raw.raw_image_visible
+def _read_nef(filespec, filesize=None, f=None):
+    ifds = _tiff_ifds(filespec, f)
+    cfa = [ifd for ifd in ifds if ifd.get("photometric") == (32803,)]  # 32803 = CFA
+    raw = max(cfa or ifds, key=lambda ifd: ifd.get("width", (0,))[0])
     info = ImageInfo()
     info.filespec = filespec
+    info.filesize = filesize
     info.filetype = "nef"
-    info.uncertain = True
+    info.uncertain = True  # width & height may include masked border pixels
     info.isfloat = False
     info.cfa_raw = True
     info.nchan = 1
     info.bytedepth = 2
-    info.height, info.width = raw.shape
-    minbits = np.ceil(np.log2(np.max(raw)))  # 5, 6, 7, ..., 16
-    minbits = np.ceil(minbits / 2) * 2  # 6, 8, 10, 12, ..., 16
-    minbits = max(minbits, 12)  # 12, 14, 16
-    info.bitdepth = int(minbits)  # can underestimate bpp if image is very dark
+    info.width = raw["width"][0]
+    info.height = raw["height"][0]
+    info.bitdepth = raw.get("bitdepth", (14,))[0]  # 12 or 14
+    info.orientation = ifds[0].get("orientation", (0,))[0]
     info = _complete(info)
     return info
 
 
-def _read_raw(filespec):  # reading the whole file ==> SLOW
+def _read_raw(filespec, filesize=None, estimate_bitdepth=True):
     info = ImageInfo()
     info.filespec = filespec
     info.filetype = "raw"
@@ -504,75 +689,141 @@ def _read_raw(filespec):  # reading the whole file ==> SLOW
     info.cfa_raw = True
     info.nchan = 1
     info.bytedepth = 2  # all sensors are at least 10-bit these days
-    info.header_size = 0  # assume no header
-    info.filesize = os.path.getsize(filespec)
-    assert info.filesize > 256 * 256, f"{filespec} is too small ({info.filesize} bytes) to be a valid camera raw file."
-    for aspect in [3/4, 2/3, 9/16]:  # try some typical aspect ratios
-        numpixels = info.filesize / info.bytedepth
-        info.height = math.sqrt(numpixels * aspect)
-        info.width = numpixels / info.height
-        wrem4 = info.width % 4
-        hrem4 = info.height % 4
-        if wrem4 == 0 and hrem4 == 0:
-            info.width = int(info.width)
-            info.height = int(info.height)
-            break
-        if wrem4 < 0.5 and hrem4 < 0.5:
-            info.width = int(info.width)
-            info.height = int(info.height)
-            info.header_size = info.filesize - info.width * info.height * info.bytedepth
-            break
-        info.width = None
-        info.height = None
-    if info.width is not None:
-        raw = np.fromfile(filespec, dtype='<u2', offset=info.header_size)  # assume x86 byte order
-        minbits = np.ceil(np.log2(np.max(raw)))  # 5, 6, 7, ..., 16
-        minbits = np.ceil(minbits / 2) * 2  # 6, 8, 10, 12, ..., 16
+    info.filesize = filesize or os.path.getsize(filespec)
+    assert info.filesize > 256 * 256, f"{os.fsdecode(filespec)} is too small ({info.filesize} bytes) to be a valid camera raw file."
+    info.width, info.height, info.header_size = _guess_dims(info.filesize, info.bytedepth)
+    if info.width is not None and not estimate_bitdepth:
+        info.bitdepth = 12  # the most common sensor bit depth
+        info = _complete(info)
+    elif info.width is not None:
+        import numpy as np  # pip install numpy; imported on first use, as it is slow to load  # noqa: PLC0415
+        shape = (info.height, info.width)
+        raw = np.memmap(filespec, dtype='<u2', mode='r', offset=info.header_size, shape=shape)  # assume x86 byte order
+        raw = raw[::max(info.height // 32, 1)]  # sample 32 rows evenly spread over the image
+        minbits = (int(raw.max()) - 1).bit_length()  # ceil(log2(max)): 5, 6, 7, ..., 16
+        minbits = (minbits + 1) & ~1  # 6, 8, 10, 12, ..., 16
         minbits = max(minbits, 10)  # 10, 12, 14, 16
-        info.bitdepth = int(minbits)  # can underestimate bpp if image is very dark
+        info.bitdepth = minbits  # can underestimate bpp if image is very dark
         info = _complete(info)
     return info
 
 
-def _read_npy(filespec):
-    with open(filespec, "rb") as npyfile:
-        magic = npyfile.read(6)
-        assert magic == b"\x93NUMPY", "Not a valid numpy file"
-        _ = npyfile.read(2)  # version number; ignore
-        header_size, = struct.unpack("<h", npyfile.read(2))
-        header = npyfile.read(header_size)
-        meta = ast.literal_eval(header.decode("utf-8"))
-        dtype = np.dtype(meta["descr"])
-        shape = meta["shape"]
-        if len(shape) in [2, 3]:  # grayscale or color
-            info = ImageInfo()
-            info.filespec = filespec
-            info.filetype = "npy"
-            info.cfa_raw = False
-            info.height, info.width = shape[:2]
-            info.nchan = 1 if len(shape) < 3 else shape[2]
-            info.isfloat = np.issubdtype(dtype, np.floating)
-            info.bytedepth = dtype.itemsize
-            info.bitdepth = info.bytedepth * 8
-            info.maxval = 1.0 if info.isfloat else 2 ** info.bitdepth - 1
-            info = _complete(info)
-            return info
-    raise ImageFileError(f"File {filespec} is not a valid NPY image file.")
+def _guess_dims(filesize, bytedepth):
+    numpixels = filesize / bytedepth
+    for aspect in (3/4, 2/3, 9/16):  # try some typical aspect ratios
+        height = math.sqrt(numpixels * aspect)
+        width = numpixels / height
+        wrem4 = width % 4
+        hrem4 = height % 4
+        if wrem4 == 0 and hrem4 == 0:  # exact fit => no header
+            return int(width), int(height), 0
+        if wrem4 < 0.5 and hrem4 < 0.5:  # near fit => assume a small header
+            width, height = int(width), int(height)
+            return width, height, filesize - width * height * bytedepth
+    return None, None, 0
+
+
+_NPY_PREAMBLE = struct.Struct("<6s2xH")  # magic, version (ignored), header size
+_NPY_DESCR = re.compile(r"'descr':\s*'([^']+)'")
+_NPY_SHAPE = re.compile(r"'shape':\s*\(([^)]*)\)")
+
+
+def _read_npy(filespec, filesize=None, head=None):
+    import numpy as np  # pip install numpy; imported on first use, as it is slow to load  # noqa: PLC0415
+    head = _probe(filespec) if head is None else head
+    magic, header_size = _NPY_PREAMBLE.unpack_from(head)
+    assert magic == b"\x93NUMPY", "Not a valid numpy file"
+    header = head[_NPY_PREAMBLE.size:_NPY_PREAMBLE.size + header_size]
+    if len(header) < header_size:  # typically 118 bytes, but up to 64 KB
+        with open(filespec, "rb") as npyfile:
+            npyfile.seek(_NPY_PREAMBLE.size)
+            header = npyfile.read(header_size)
+    header = header.decode("latin1")  # {'descr': '<u2', 'fortran_order': False, 'shape': (10, 20, 5), }
+    descr = _NPY_DESCR.search(header)
+    shape = _NPY_SHAPE.search(header)
+    if descr is None or shape is None:
+        raise ImageFileError(f"File {os.fsdecode(filespec)} is not a valid NPY file.")
+    dtype = np.dtype(descr.group(1))
+    shape = tuple(int(dim) for dim in shape.group(1).split(",") if dim.strip())
+    if len(shape) in [2, 3]:  # grayscale or color
+        info = ImageInfo()
+        info.filespec = filespec
+        info.filesize = filesize
+        info.filetype = "npy"
+        info.cfa_raw = False
+        info.height, info.width = shape[:2]
+        info.nchan = 1 if len(shape) < 3 else shape[2]
+        info.isfloat = np.issubdtype(dtype, np.floating)
+        info.bytedepth = dtype.itemsize
+        info.bitdepth = info.bytedepth * 8
+        info.maxval = 1.0 if info.isfloat else 2 ** info.bitdepth - 1
+        info = _complete(info)
+        return info
+    raise ImageFileError(f"File {os.fsdecode(filespec)} is not a valid NPY image file.")
+
+
+_EXIF_TO_ROT90 = (0, 0, 0, 2, 0, 1, 3, 3, 1)  # EXIF orientation 0..8 => rot90_ccw_steps
 
 
 def _complete(info):
-    info.filesize = info.filesize or os.path.getsize(info.filespec)
-    info.maxval = info.maxval or 2 ** info.bitdepth - 1
-    info.bitdepth = info.bitdepth or int(math.log2(info.maxval + 1))
-    info.bytedepth = info.bytedepth or (2 if info.maxval > 255 else 1)
+    # Only fill in what the handler left out; handlers that know the exact
+    # bit depth (PNG, JPEG, ...) set maxval and bytedepth themselves
+
+    if not info.filesize:
+        info.filesize = os.path.getsize(info.filespec)
+    if not info.maxval:
+        info.maxval = 2 ** info.bitdepth - 1
+    if not info.bitdepth:
+        info.bitdepth = int(math.log2(info.maxval + 1))
+    if not info.bytedepth:
+        info.bytedepth = 2 if info.maxval > 255 else 1
+    if info.uncertain is None:
+        info.uncertain = False
+    if not info.header_size:
+        info.header_size = 0  # None => 0
+    orientation = info.orientation or 0  # None => 0
+    info.orientation = orientation
+    info.rot90_ccw_steps = _EXIF_TO_ROT90[orientation] if 0 <= orientation <= 8 else 0
     info.nbytes = info.width * info.height * info.nchan * info.bytedepth
-    info.uncertain = False if info.uncertain is None else info.uncertain
-    info.orientation = info.orientation or 0  # None => 0
-    info.rot90_ccw_steps = info.rot90_ccw_steps or 0  # None => 0
-    info.header_size = info.header_size or 0  # None => 0
     if not info.multi_picture:
         info.multi_picture = False
         info.num_images = 1
         info.image_sizes = [info.filesize]
         info.image_offsets = [0]
     return info
+
+
+_HANDLERS = {"png": _read_png,
+             "pnm": _read_pnm,
+             "pgm": _read_pnm,
+             "ppm": _read_pnm,
+             "pfm": _read_pfm,
+             "bmp": _read_bmp,
+             "jpeg": _read_jpeg,
+             "jpg": _read_jpeg,
+             "insp": _read_insp,
+             "tiff": _read_tiff,
+             "tif": _read_tiff,
+             "exr": _read_exr,
+             "hdr": _read_hdr,
+             "dng": _read_dng,
+             "cr2": _read_cr2,
+             "nef": _read_nef,
+             "raw": _read_raw,
+             "npy": _read_npy}
+
+_FAST_HANDLERS = {"raw": functools.partial(_read_raw, estimate_bitdepth=False)}
+
+# Handlers that can parse the head of the file that was read for detecting
+# the file type, and handlers that can parse the file through the handle it
+# was read from, instead of opening the file again
+
+_HEAD_HANDLERS = {_read_png, _read_pnm, _read_pfm, _read_bmp, _read_hdr, _read_npy}
+_FILE_HANDLERS = {_read_jpeg, _read_insp, _read_tiff, _read_exr, _read_dng, _read_cr2, _read_nef}
+
+# Check that we have a parser for each known filetype, and
+# conversely, that all filetypes are listed for which we have
+# a parser
+
+_filetypes = {ext[1:] for ext in FILETYPES}  # .ext => ext
+assert set(_HANDLERS) == _filetypes, set(_HANDLERS) ^ _filetypes
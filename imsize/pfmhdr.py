@@ -3,7 +3,7 @@ A minimal header parser for PFM images, meant solely for querying the
 dimensions and bit depth.
 """
 
-import re  # built-in library
+import os  # built-in library
 
 
 ######################################################################################
@@ -18,10 +18,20 @@ def dims(filespec, verbose=False):
     Returns the dimensions (width, height, and number of channels) of the given
     PFM file. Also returns the nominal scale of the pixel values (typically 1.0).
     """
-    with open(filespec, "rb") as f:
+    with open(filespec, "rb", buffering=0) as f:  # unbuffered: one small read
         header = f.read(64)  # should be enough for any valid header
-        shape, scale = __parse_header(header, filespec, verbose)
-        return (shape, scale)
+    return dims_from_buffer(header, filespec, verbose)
+
+
+def dims_from_buffer(buf, filespec="", verbose=False):
+    """
+    Like dims(), but parses the header from the given buffer (bytes, mmap,
+    memoryview, ...) that holds the start of a PFM file. The filespec
+    is only used in messages.
+    """
+    header = bytes(buf[:64])  # should be enough for any valid header
+    shape, scale = __parse_header(header, filespec, verbose)
+    return (shape, scale)
 
 
 ######################################################################################
@@ -32,17 +42,25 @@ def dims(filespec, verbose=False):
 
 
 def __parse_header(header, filespec, verbose=False):
-    regex_pfm_header = b"(^(P[Ff])\\s+(\\d+)\\s+(\\d+)\\s+([+-]?\\d+(?:\\.\\d+)?)\\s)"
-    match = re.search(regex_pfm_header, header)
-    if match is not None:
-        header, typestr, width, height, scale = match.groups()
+    parts = header.split(None, 4)  # "PF", width, height, scale, raster data
+    terminated = len(parts) == 5 or header[-1:].isspace()  # whitespace after scale
+    if len(parts) >= 4 and terminated and parts[0] in (b"PF", b"Pf") and parts[1].isdigit() and parts[2].isdigit() and _is_decimal(parts[3]):
+        typestr, width, height, scale = parts[:4]
         width, height, scale = int(width), int(height), float(scale)
         numch = 3 if typestr == b"PF" else 1
         shape = (height, width, numch) if numch == 3 else (height, width)
         dtype = "<f" if scale < 0.0 else ">f"
         scale = abs(scale)
         if verbose:
-            print(f"Reading file {filespec} ", end='')
+            print(f"Reading file {os.fsdecode(filespec)} ", end='')
             print(f"(w={width}, h={height}, c={numch}, scale={scale:.3f}, byteorder='{dtype[0]}')")
         return (shape, scale)
-    raise RuntimeError(f"File {filespec} is not a valid PFM file.")
+    raise RuntimeError(f"File {os.fsdecode(filespec)} is not a valid PFM file.")
+
+
+def _is_decimal(token):
+    # [+-]?\d+(\.\d+)?, that is, no exponent, nan, inf, or underscores that
+    # float() would otherwise accept
+    digits = token[1:] if token[:1] in (b"+", b"-") else token
+    intpart, dot, fraction = digits.partition(b".")
+    return intpart.isdigit() and (not dot or fraction.isdigit())
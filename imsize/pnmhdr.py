@@ -3,7 +3,12 @@ A minimal header parser for PNM/PGM/PPM images, meant solely for querying the
 dimensions and bit depth.
 """
 
-import re  # built-in library
+import os  # built-in library
+
+
+# Enough for any header without comments, and for a few lines of comments
+
+_HEADER_SIZE = 1024
 
 
 ######################################################################################
@@ -18,10 +23,39 @@ def dims(filespec, verbose=False):
     PNM/PGM/PPM file. Also returns the maximum representable value of a pixel
     (typically 255, 1023, 4095, or 65535).
     """
-    with open(filespec, "rb") as f:
-        header = f.read(64)  # should be enough for any valid header
-        shape, maxval = __parse_header(header, filespec, verbose)
-        return (shape, maxval)
+    header = _read_header(filespec)
+    return dims_from_buffer(header, filespec, verbose)
+
+
+def dims_from_buffer(buf, filespec="", verbose=False):
+    """
+    Like dims(), but parses the header from the given buffer (bytes, mmap,
+    memoryview, ...) that holds the start of a PNM/PGM/PPM file. The first 64
+    bytes are enough unless the header has comments, so batch callers that
+    already have the start of each file in memory need not open the files
+    again. The filespec is only used in messages.
+    """
+    header = bytes(buf[:_HEADER_SIZE])
+    result = __parse_header(header)
+    if result is None:
+        raise RuntimeError(f"File {os.fsdecode(filespec)} is not a valid PNM/PGM/PPM file.")
+    shape, maxval = result
+    if verbose:
+        height, width = shape[:2]
+        numch = shape[2] if len(shape) == 3 else 1
+        print(f"Reading file {os.fsdecode(filespec)} ", end='')
+        print(f"(w={width}, h={height}, c={numch}, maxval={maxval})")
+    return (shape, maxval)
+
+
+def maybe_dims(filespec):
+    """
+    Like dims(), but returns None instead of raising an exception if the given
+    file is not a valid PNM/PGM/PPM file. Meant for cheaply probing files that
+    may or may not be PNMs.
+    """
+    header = _read_header(filespec)
+    return __parse_header(header)
 
 
 ######################################################################################
@@ -31,16 +65,48 @@ def dims(filespec, verbose=False):
 ######################################################################################
 
 
-def __parse_header(header, filespec, verbose=False):
-    regex_pnm_header = b"(^(P[56])\\s+(\\d+)\\s+(\\d+)\\s+(\\d+)\\s)"
-    match = re.search(regex_pnm_header, header)
-    if match is not None:
-        header, typestr, width, height, maxval = match.groups()
-        width, height, maxval = int(width), int(height), int(maxval)
-        numch = 3 if typestr == b"P6" else 1
-        shape = (height, width, numch) if typestr == b"P6" else (height, width)
-        if verbose:
-            print(f"Reading file {filespec} ", end='')
-            print(f"(w={width}, h={height}, c={numch}, maxval={maxval})")
-        return (shape, maxval)
-    raise RuntimeError(f"File {filespec} is not a valid PNM/PGM/PPM file.")
+def _read_header(filespec):
+    with open(filespec, "rb", buffering=0) as f:  # unbuffered: one small read
+        return f.read(_HEADER_SIZE)
+
+
+def __parse_header(header):
+    if header[:2] in (b"P5", b"P6"):  # reject other files before tokenizing
+        parts = header.split(None, 4)  # "P5", width, height, maxval, raster data
+        terminated = len(parts) == 5 or header[-1:].isspace()  # whitespace after maxval
+        if b"#" in b"".join(parts[:4]):  # comments are rare, so only look for them here
+            parts, terminated = _split_with_comments(header)
+        if len(parts) >= 4 and terminated and len(parts[0]) == 2 and all(p.isdigit() for p in parts[1:4]):
+            width, height = int(parts[1]), int(parts[2])
+            maxval = 255 if parts[3] == b"255" else int(parts[3])  # 255 is by far the most common
+            is_p6 = header[1] == 0x36  # b"6"
+            shape = (height, width, 3) if is_p6 else (height, width)
+            return (shape, maxval)
+    return None
+
+
+_WHITESPACE = b" \t\n\r\v\f"
+
+
+def _split_with_comments(header):
+    # Like header.split(None, 4), but skipping comments, which run from "#"
+    # to the end of the line; also returns whether maxval is terminated by
+    # whitespace (or a comment), as required before the raster data
+    parts = []
+    pos = 0
+    end = len(header)
+    while len(parts) < 4:
+        while pos < end and (header[pos] in _WHITESPACE or header[pos] == 0x23):
+            if header[pos] == 0x23:  # b"#" => skip to the end of the line
+                while pos < end and header[pos] not in b"\r\n":
+                    pos += 1
+            else:
+                pos += 1
+        start = pos
+        while pos < end and header[pos] not in _WHITESPACE and header[pos] != 0x23:
+            pos += 1
+        if pos == start:  # end of buffer
+            break
+        parts.append(header[start:pos])
+    terminated = pos < end
+    return parts, terminated
@@ -0,0 +1,109 @@
+"""
+A minimal header parser for TIFF-based images (TIFF, DNG, NEF, CR2, ...),
+meant solely for querying the dimensions, bit depth, and orientation.
+"""
+
+import os      # built-in library
+import mmap    # built-in library
+import struct  # built-in library
+
+
+######################################################################################
+#
+#  P U B L I C   A P I
+#
+######################################################################################
+
+
+TAGS = {0x0100: "width",
+        0x0101: "height",
+        0x0102: "bitdepth",
+        0x0106: "photometric",
+        0x0112: "orientation",
+        0x0115: "nchan",
+        0x014a: "subifds"}
+
+
+def ifds(filespec, verbose=False):
+    """
+    Returns the basic image tags (see TAGS) of the main image directory (IFD0)
+    and its sub-IFDs in the given TIFF-based file. The result is a list of
+    dicts, one per IFD, mapping tag names to tuples of integers, with IFD0
+    first. Tags that are not present in an IFD are omitted from its dict.
+    """
+    with open(filespec, "rb") as f:
+        return ifds_from_file(f, filespec, verbose)
+
+
+def ifds_from_file(f, filespec="", verbose=False):
+    """
+    Like ifds(), but parses the given open binary file, regardless of its
+    current position, so that callers that already have the file open need
+    not open it again. The filespec is only used in messages.
+    """
+    if os.fstat(f.fileno()).st_size >= 8:  # cannot mmap an empty file
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            result = parse(mm, 0, filespec)
+            if verbose:
+                print(f"Reading file {os.fsdecode(filespec)} ", end='')
+                print(f"(num_ifds={len(result)}, ifd0={result[0]})")
+            return result
+    raise RuntimeError(f"File {os.fsdecode(filespec)} is not a valid TIFF file.")
+
+
+def parse(buf, base=0, filespec=""):
+    """
+    Like ifds(), but parses a TIFF structure that starts at offset 'base' in
+    the given buffer (bytes, mmap, ...). All offsets in the TIFF structure are
+    relative to 'base', as is the case with EXIF data embedded in JPEG files.
+    """
+    byteorder = {b"II*\x00": "<", b"MM\x00*": ">"}.get(bytes(buf[base:base + 4]))
+    if byteorder is None:
+        raise RuntimeError(f"File {os.fsdecode(filespec)} is not a valid TIFF file.")
+    try:
+        ifd0_offset, = _u32[byteorder](buf, base + 4)
+        ifd0 = _parse_ifd(buf, base, byteorder, ifd0_offset)
+        result = [ifd0] + [_parse_ifd(buf, base, byteorder, offset) for offset in ifd0.get("subifds", ())]
+    except struct.error as e:
+        raise RuntimeError(f"File {os.fsdecode(filespec)} has a truncated or corrupted TIFF header.") from e
+    else:
+        return result
+
+
+######################################################################################
+#
+#  I N T E R N A L   F U N C T I O N S
+#
+######################################################################################
+
+
+_u16 = {bo: struct.Struct(f"{bo}H").unpack_from for bo in "<>"}
+_u32 = {bo: struct.Struct(f"{bo}I").unpack_from for bo in "<>"}
+_entry = {bo: struct.Struct(f"{bo}HHI4s").unpack_from for bo in "<>"}  # tag, type, count, value
+
+_TYPES = {1: ("B", 1),   # BYTE
+          3: ("H", 2),   # SHORT
+          4: ("I", 4),   # LONG
+          13: ("I", 4)}  # IFD
+
+_scalar = {(bo, dtype): struct.Struct(f"{bo}{code}").unpack_from
+           for bo in "<>" for dtype, (code, _size) in _TYPES.items()}
+
+
+def _parse_ifd(buf, base, byteorder, offset):
+    tags = {}
+    pos = base + offset
+    count, = _u16[byteorder](buf, pos)
+    for i in range(count):
+        tag, dtype, nvalues, value = _entry[byteorder](buf, pos + 2 + 12 * i)
+        name = TAGS.get(tag)
+        if name is not None and dtype in _TYPES:
+            code, size = _TYPES[dtype]
+            if nvalues == 1:  # the common case
+                tags[name] = _scalar[byteorder, dtype](value)
+            elif nvalues * size <= 4:  # values stored inline
+                tags[name] = struct.unpack_from(f"{byteorder}{nvalues}{code}", value)
+            else:  # values stored elsewhere, value is the offset
+                value_offset, = _u32[byteorder](value)
+                tags[name] = struct.unpack_from(f"{byteorder}{nvalues}{code}", buf, base + value_offset)
+    return tags
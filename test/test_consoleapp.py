@@ -0,0 +1,206 @@
+import os
+import io
+import sys
+import shutil
+import sqlite3
+import contextlib
+import unittest
+from unittest import mock
+import tempfile
+from imsize import consoleapp
+
+
+thisdir = os.path.dirname(__file__)
+imagedir = os.path.join(thisdir, "images")
+
+
+def _copy_image(src, dst):
+    shutil.copyfile(os.path.join(imagedir, src), dst)
+    return os.fsdecode(dst)  # as listed by os.scandir() on a str path
+
+
+def _write(path, data=b""):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _age(path, seconds=10):
+    # backdate the mtime of path, so that its listing is not considered racy
+    past = os.stat(path).st_mtime_ns - seconds * 10 ** 9
+    os.utime(path, ns=(past, past))
+    return past
+
+
+class ConsoleAppTest(unittest.TestCase):
+
+    def setUp(self):
+        # a fresh scratch directory for each test, with the caches in it
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+        self.cachedir = os.path.join(self.tmpdir, "cache")
+        patcher = mock.patch.object(consoleapp, "CACHE_DIR", self.cachedir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _path(self, *names):
+        return os.path.join(self.tmpdir, *names)
+
+    def _main(self, *args):
+        with mock.patch.object(sys, "argv", ["imsize", *args]), contextlib.redirect_stdout(io.StringIO()) as out:
+            consoleapp.main()
+        return out.getvalue().splitlines()
+
+    def _count_misses(self):
+        # patches consoleapp.read_all to record the filespecs that missed the cache
+        misses = []
+        read_all = consoleapp.read_all
+        patcher = mock.patch.object(consoleapp, "read_all", lambda filespecs, fast=False: misses.append(filespecs) or read_all(filespecs, fast))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return misses
+
+    def test_infocache_non_utf8_filename(self):
+        filespec = _copy_image("landscape_1.png", os.path.join(os.fsencode(self.tmpdir), b"\xff\xfe.png"))
+        db = consoleapp.open_infocache()
+        self.addCleanup(db.close)
+        results = consoleapp.read_all_cached([filespec], db)
+        self.assertEqual(results[filespec].width, 600)
+        with mock.patch.object(consoleapp, "read_all", lambda filespecs, fast=False: {}):  # must be served from the cache
+            results = consoleapp.read_all_cached([filespec], db)
+        self.assertEqual(results[filespec].width, 600)
+
+    def test_dircache_racy_listing(self):
+        _copy_image("landscape_1.png", self._path("a.png"))
+        dircache = {}
+        self.assertEqual(consoleapp.find_files([self.tmpdir], dircache), [(self._path("a.png"), "a.png")])
+        self.assertEqual(dircache, {})  # just modified => not cached yet
+        past = _age(self.tmpdir)
+        consoleapp.find_files([self.tmpdir], dircache)
+        self.assertEqual(dircache[self.tmpdir]["files"], ["a.png"])
+        self.assertEqual(dircache[self.tmpdir]["mtime_ns"], past)
+
+    def test_dircache_invalid_entries(self):
+        _write(self._path("a.png"))
+        mtime = _age(self.tmpdir)
+        version = consoleapp.imsize.__version__
+        for cached in [{"mtime_ns": mtime, "version": version},
+                       {"mtime_ns": mtime, "version": version, "files": "a.png"},
+                       {"mtime_ns": mtime, "version": version, "files": [1, 2]},
+                       {"mtime_ns": mtime, "version": "0.0.1", "files": []},  # listed before an upgrade
+                       {"mtime_ns": mtime, "files": []},
+                       ["a.png"]]:
+            dircache = {self.tmpdir: cached}
+            self.assertEqual(consoleapp.find_files([self.tmpdir], dircache), [(self._path("a.png"), "a.png")])
+            self.assertEqual(dircache[self.tmpdir]["files"], ["a.png"])
+        dircache[self.tmpdir]["files"] = ["b.png"]  # well-formed and current => trusted
+        self.assertEqual(consoleapp.find_files([self.tmpdir], dircache), [(self._path("b.png"), "b.png")])
+
+    def test_dircache_pruning(self):
+        today = consoleapp._today()
+        dircache = {self._path("gone"): {"mtime_ns": 1, "files": [], "visited": today},
+                    "/stale": {"mtime_ns": 1, "files": [], "visited": today - consoleapp.DIRCACHE_MAX_AGE - 1},
+                    "/legacy": {"mtime_ns": 1, "files": []},
+                    "/recent": {"mtime_ns": 1, "files": [], "visited": today - 1}}
+        consoleapp.find_files([self._path("gone")], dircache)  # no longer exists
+        consoleapp.prune_dircache(dircache)
+        self.assertEqual(list(dircache), ["/recent"])
+
+    def test_find_files(self):
+        os.mkdir(self._path("other"))
+        os.mkdir(self._path("sub"))
+        for name in ["b.png", "A.Jpg", "c.PNG", "notes.txt", ".hidden.png", os.path.join("sub", "d.png"), os.path.join("other", "e.bmp")]:
+            _write(self._path(name))
+        paths = [self.tmpdir, self._path("sub", "d.png"), self._path("other"), self._path("missing")]
+        found = consoleapp.find_files(paths)
+        self.assertEqual(sorted(found[:3]), [(self._path(name), name) for name in ["A.Jpg", "b.png", "c.PNG"]])
+        self.assertEqual(found[3:], [(self._path("sub", "d.png"), "d.png"), (self._path("other", "e.bmp"), "e.bmp")])
+
+    def test_find_files_unreadable(self):
+        _write(self._path("a.png"))
+        os.mkdir(self._path("locked"))
+        scandir = os.scandir
+        def _scandir(path):
+            if path == self._path("locked"):
+                raise PermissionError(13, "Permission denied", path)
+            return scandir(path)
+        dircache = {self._path("locked"): {"mtime_ns": 1, "files": ["gone.png"]}}
+        with mock.patch.object(os, "scandir", _scandir):
+            found = consoleapp.find_files([self._path("locked"), self.tmpdir], dircache)
+        self.assertEqual(found, [(self._path("a.png"), "a.png")])
+        self.assertNotIn(self._path("locked"), dircache)
+
+    def test_fast(self):
+        filespec = self._path("sensor.raw")
+        with open(filespec, "wb") as f:
+            f.truncate(640 * 480 * 2)  # headerless 640 x 480 x 16-bit, all zeros
+        _age(self.tmpdir)
+        estimated = "sensor.raw: 640 x 480 x 1 x 10 bits => 0.6 MB [estimated], 0.3 MP"
+        assumed = "sensor.raw: 640 x 480 x 1 x 12 bits => 0.6 MB [estimated], 0.3 MP"
+        for args, expected in [((), estimated), (("--fast",), assumed), ((), estimated), (("--fast",), assumed)]:
+            self.assertEqual(self._main(*args, self.tmpdir)[1], expected, args)  # cached separately for each mode
+
+    def test_infocache_invalidation(self):
+        filespec = _copy_image("landscape_1.png", self._path("image.png"))
+        db = consoleapp.open_infocache()
+        self.addCleanup(db.close)
+        misses = self._count_misses()
+        self.assertEqual(consoleapp.read_all_cached([filespec], db)[filespec].width, 600)
+        self.assertEqual(consoleapp.read_all_cached([filespec], db)[filespec].width, 600)
+        _copy_image("sample_640x426.bmp", self._path("image.png"))  # same name, new size & mtime
+        self.assertEqual(consoleapp.read_all_cached([filespec], db)[filespec].width, 640)
+        self.assertEqual(consoleapp.read_all_cached([filespec], db)[filespec].width, 640)
+        self.assertEqual(misses, [[filespec], [], [filespec], []])
+
+    def test_infocache_pruning(self):
+        filespec = _copy_image("landscape_1.png", self._path("image.png"))
+        db = consoleapp.open_infocache()
+        self.addCleanup(db.close)
+        consoleapp.read_all_cached([filespec], db)
+        today = consoleapp._today()
+        with db:
+            db.execute("UPDATE cache SET visited=?", (today - 1,))
+            db.execute("INSERT INTO cache VALUES (?, 0, 0, '', 0, NULL, ?)", (b"/deleted.png", today - consoleapp.INFOCACHE_MAX_AGE - 1))
+        misses = self._count_misses()
+        self.assertEqual(consoleapp.read_all_cached([filespec], db)[filespec].width, 600)
+        self.assertEqual(misses, [[]])
+        self.assertEqual(db.execute("SELECT path, visited FROM cache").fetchall(), [(os.fsencode(filespec), today)])
+
+    def test_infocache_old_schema(self):
+        os.mkdir(self.cachedir)
+        with sqlite3.connect(os.path.join(self.cachedir, "info.db")) as db:
+            db.execute("CREATE TABLE cache (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, version TEXT, info BLOB)")
+        db.close()
+        filespec = _copy_image("landscape_1.png", self._path("image.png"))
+        db = consoleapp.open_infocache()
+        self.addCleanup(db.close)
+        misses = self._count_misses()
+        for _ in range(2):
+            self.assertEqual(consoleapp.read_all_cached([filespec], db)[filespec].width, 600)
+        self.assertEqual(misses, [[filespec], []])
+
+    def test_main(self):
+        images = self._path("images")
+        os.mkdir(images)
+        for i in range(1100):  # more than one batch of output lines
+            _write(os.path.join(images, f"{i:04d}.pgm"), b"P5 4 3 255\n" + bytes(12))
+        _copy_image("landscape_1.png", os.path.join(images, "big.png"))
+        _write(os.path.join(images, "broken.png"), b"not a png")
+        _age(images)
+        expected = ["See 'imsize --help' for command-line options."]
+        expected += [f"{i:04d}.pgm: 4 x 3 x 1 x 8 bits => 0.0 MB, 0.0 MP" for i in range(1100)]
+        expected += ["big.png: 600 x 450 x 3 x 8 bits => 0.8 MB, 0.3 MP",
+                     f"broken.png: ImageFileError: File {os.path.join(images, 'broken.png')} is not a valid PNG file.",
+                     "Scanned 1101 images, total 0.6 MB compressed, 0.8 MB uncompressed"]
+        self.assertEqual(self._main("--nocache", images), expected)
+        self.assertFalse(os.path.exists(self.cachedir))
+        self.assertEqual(self._main(images), expected)  # cold cache
+        self.assertEqual(len(consoleapp.load_cache("dirlist.json")[images]["files"]), 1102)
+        self.assertTrue(os.path.exists(os.path.join(self.cachedir, "info.db")))
+        misses = self._count_misses()
+        self.assertEqual(self._main(images), expected)  # warm cache
+        self.assertEqual(misses, [[os.path.join(images, "broken.png")]])  # errors are not cached
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,55 +1,65 @@
 from pathlib import Path
 import os
-import glob
+import sys
+import struct
+import subprocess
+import contextlib
 import unittest
+from unittest import mock
 import tempfile
 import imsize
+from imsize import pfmhdr
+from imsize import pnmhdr
 
 
 thisdir = os.path.dirname(__file__)
 imagedir = os.path.join(thisdir, "images")
 
 
+def _find(dirname, prefix="", suffix=""):
+    # sorted list of files in dirname whose names match prefix*suffix
+    with os.scandir(dirname) as entries:
+        return sorted(e.path for e in entries if e.name.startswith(prefix) and e.name.endswith(suffix))
+
+
+def _attrs(info, expected):
+    # the attributes of info that are named in expected, for one-shot comparison
+    return {name: getattr(info, name) for name in expected}
+
+
+@contextlib.contextmanager
+def _tempfile(data, suffix=""):
+    # name of a temporary file that holds the given bytes until the end of the with-block
+    with tempfile.NamedTemporaryFile(suffix=suffix) as fp:
+        fp.write(data)
+        fp.flush()
+        yield fp.name
+
+
 class ReadTest(unittest.TestCase):
 
     def test_png(self):
-        pngs = glob.glob(os.path.join(imagedir, "*.png"))
+        pngs = _find(imagedir, suffix=".png")
         self.assertTrue(len(pngs) > 0)
         for i, png in enumerate(sorted(pngs)):
             info = imsize.read(Path(png))
-            self.assertEqual(info.filetype, "png")
-            self.assertEqual(info.nchan, 3)
             self.assertTrue(info.width in [600, 450])
             self.assertTrue(info.height in [600, 450])
-            self.assertEqual(info.bitdepth, 8)
-            self.assertEqual(info.bytedepth, 1)
-            self.assertEqual(info.maxval, 255)
-            self.assertEqual(info.isfloat, False)
-            self.assertEqual(info.uncertain, False)
-            self.assertEqual(info.cfa_raw, False)
-            self.assertEqual(info.nbytes, 600 * 450 * 3)
-            self.assertEqual(info.orientation, 0)
+            expected = dict(filetype="png", nchan=3, bitdepth=8, bytedepth=1, maxval=255, isfloat=False,
+                            uncertain=False, cfa_raw=False, nbytes=600 * 450 * 3, orientation=0)
+            self.assertEqual(_attrs(info, expected), expected)
 
     def test_bmp(self):
-        bmps = glob.glob(os.path.join(imagedir, "*.bmp"))
+        bmps = _find(imagedir, suffix=".bmp")
         self.assertTrue(len(bmps) > 0)
         for i, bmp in enumerate(sorted(bmps)):
             info = imsize.read(Path(bmp))
-            self.assertEqual(info.filetype, "bmp")
-            self.assertEqual(info.nchan, 3)
-            self.assertTrue(info.width, 640)
-            self.assertTrue(info.height, 426)
-            self.assertEqual(info.bitdepth, 8)
-            self.assertEqual(info.bytedepth, 1)
-            self.assertEqual(info.maxval, 255)
-            self.assertEqual(info.isfloat, False)
-            self.assertEqual(info.uncertain, False)
-            self.assertEqual(info.cfa_raw, False)
-            self.assertEqual(info.nbytes, 640 * 426 * 3)
-            self.assertEqual(info.orientation, 0)
+            expected = dict(filetype="bmp", nchan=3, width=640, height=426, bitdepth=8, bytedepth=1, maxval=255,
+                            isfloat=False, uncertain=False, cfa_raw=False, nbytes=640 * 426 * 3, orientation=0)
+            self.assertEqual(_attrs(info, expected), expected)
 
     def test_dng_ricoh(self):
-        dngs = glob.glob(os.path.join(imagedir, "R001*.DNG"))
+        dngs = _find(imagedir, "R001", ".DNG")
         self.assertTrue(len(dngs) > 0)
         for i, dng in enumerate(sorted(dngs)):
             info = imsize.read(Path(dng))
@@ -67,7 +77,7 @@ class ReadTest(unittest.TestCase):
             self.assertEqual(info.orientation, 0)
 
     def test_cr2(self):
-        cr2s = glob.glob(os.path.join(imagedir, "RAW_CANON_1000D.CR2"))
+        cr2s = _find(imagedir, "RAW_CANON_1000D.CR2")
         self.assertTrue(len(cr2s) > 0)
         for i, cr2 in enumerate(sorted(cr2s)):
             info = imsize.read(Path(cr2))
@@ -84,8 +94,32 @@ class ReadTest(unittest.TestCase):
             self.assertEqual(info.nbytes, info.width * info.height * info.bytedepth)
             self.assertEqual(info.orientation, 8)
 
+    def test_nef(self):
+        # synthetic NEF-like header: a thumbnail in IFD0, the CFA raw in a SubIFD
+        ifd0 = [(0x00fe, 4, 1, 1), (0x0100, 4, 1, 160), (0x0101, 4, 1, 120),
+                (0x0112, 3, 1, 6 << 16), (0x014a, 4, 1, 74)]
+        subifd = [(0x00fe, 4, 1, 0), (0x0100, 4, 1, 6032), (0x0101, 4, 1, 4032),
+                  (0x0102, 3, 1, 14 << 16), (0x0106, 3, 1, 32803 << 16)]
+        header = b"MM\x00*" + struct.pack(">I", 8)
+        for ifd in [ifd0, subifd]:
+            header += struct.pack(">H", len(ifd))
+            header += b"".join(struct.pack(">HHII", *entry) for entry in ifd)
+            header += struct.pack(">I", 0)
+        with _tempfile(header, ".nef") as filespec:
+            info = imsize.read(filespec)
+            self.assertEqual(info.filetype, "nef")
+            self.assertEqual(info.nchan, 1)
+            self.assertEqual(info.width, 6032)
+            self.assertEqual(info.height, 4032)
+            self.assertEqual(info.bitdepth, 14)
+            self.assertEqual(info.bytedepth, 2)
+            self.assertEqual(info.maxval, 16383)
+            self.assertEqual(info.cfa_raw, True)
+            self.assertEqual(info.nbytes, 6032 * 4032 * 2)
+            self.assertEqual(info.orientation, 6)
+
     def test_exr(self):
-        exrs = glob.glob(os.path.join(imagedir, "*.exr"))
+        exrs = _find(imagedir, suffix=".exr")
         self.assertTrue(len(exrs) > 0)
         for i, exr in enumerate(sorted(exrs)):
             info = imsize.read(Path(exr))
@@ -98,8 +132,26 @@ class ReadTest(unittest.TestCase):
             self.assertEqual(info.bitdepth, 16)
             self.assertEqual(info.bytedepth, 2)
 
+    def test_exr_long_header(self):
+        # synthetic EXR headers that do not fit in the first 64 KB read
+        def attr(name, value, attr_type=b"string"):
+            return name + b"\x00" + attr_type + b"\x00" + struct.pack("<I", len(value)) + value
+        channels = attr(b"channels", b"".join(c + b"\x00" + struct.pack("<iB3xii", 2, 0, 1, 1) for c in [b"B", b"G", b"R"]) + b"\x00")
+        window = attr(b"dataWindow", struct.pack("<4i", 0, 0, 639, 479), b"box2i")
+        for padding in [65000, 65500, 65530, 300000]:  # crosses the 64 KB mark mid-attribute
+            comments = attr(b"comments", b"x" * padding)
+            for attrs in [comments + channels + window, channels + comments + window]:
+                with _tempfile(b"\x76\x2f\x31\x01" + struct.pack("<I", 2) + attrs + b"\x00", ".exr") as filespec:
+                    info = imsize.read(filespec)
+                    self.assertEqual((info.width, info.height, info.nchan, info.bitdepth), (640, 480, 3, 32))
+        # truncated or corrupt: attribute size far beyond the end of the file
+        for attrs in [attr(b"comments", b"x" * 100000)[:70000], attr(b"comments", b"")[:-4] + b"\xff\xff\xff\x7f" + channels]:
+            with _tempfile(b"\x76\x2f\x31\x01" + struct.pack("<I", 2) + attrs, ".exr") as filespec:
+                with self.assertRaises(imsize.ImageFileError):
+                    imsize.read(filespec)
+
     def test_npy(self):
-        npys = glob.glob(os.path.join(imagedir, "*.npy"))
+        npys = _find(imagedir, suffix=".npy")
         self.assertTrue(len(npys) > 0)
         for i, npy in enumerate(sorted(npys)):
             info = imsize.read(Path(npy))
@@ -112,8 +164,40 @@ class ReadTest(unittest.TestCase):
             self.assertEqual(info.bytedepth, 2)
             self.assertEqual(info.nbytes, 20 * 10 * 5 * 2)
 
+    def test_pnm(self):
+        raster = bytes(range(0x20, 0x40))  # includes whitespace and "#"
+        for header, shape, maxval in [(b"P5\n4 3\n255\n", (3, 4), 255),
+                                      (b"P6 4 3 65535 ", (3, 4, 3), 65535),
+                                      (b"P6\n# Created by GIMP version 2.10.30 PNM plug-in\n600 450\n255\n", (450, 600, 3), 255),
+                                      (b"P5#comment\n4 # width\r3\n#\n1023\n", (3, 4), 1023),
+                                      (b"P5 4 3 65535# comment after maxval\n", (3, 4), 65535)]:
+            self.assertEqual(pnmhdr.dims_from_buffer(header + raster), (shape, maxval))
+        for header in [b"P5\n4 3\n", b"P5 4 3 255", b"P5 4 3 # 255\n", b"P5 4 -3 255\n", b"P4 4 3 255\n", b"P54 3 255\n", b""]:
+            with self.assertRaises(RuntimeError):
+                pnmhdr.dims_from_buffer(header)
+        with _tempfile(b"\x89PNG\r\n\x1a\n" + raster, ".pgm") as filespec:  # not a PNM
+            self.assertIsNone(pnmhdr.maybe_dims(filespec))
+        with _tempfile(b"P5\n4 3\n65535\n" + bytes(4 * 3 * 2), ".pgm") as filespec:
+            self.assertEqual(pnmhdr.maybe_dims(filespec), ((3, 4), 65535))
+            info = imsize.read(filespec)
+            expected = dict(filetype="pnm", width=4, height=3, nchan=1, bitdepth=16, bytedepth=2, maxval=65535)
+            self.assertEqual(_attrs(info, expected), expected)
+
+    def test_pfm(self):
+        for header, shape, scale in [(b"PF\n4 3\n-1.0\n", (3, 4, 3), 1.0),
+                                     (b"Pf 4 3 +2.5 ", (3, 4), 2.5),
+                                     (b"PF\n4 3\n1\n", (3, 4, 3), 1.0)]:
+            self.assertEqual(pfmhdr.dims_from_buffer(header), (shape, scale))
+        for scale in [b"nan", b"inf", b"-inf", b"1e0", b"1_0", b"1.", b".5", b"--1"]:
+            with self.assertRaises(RuntimeError):
+                pfmhdr.dims_from_buffer(b"PF 4 3 " + scale + b"\n")
+        with _tempfile(b"PF\n4 3\n-1.0\n" + bytes(4 * 3 * 3 * 4), ".pfm") as filespec:
+            info = imsize.read(filespec)
+            expected = dict(filetype="pfm", width=4, height=3, nchan=3, isfloat=True, bitdepth=32, bytedepth=4, maxval=1.0)
+            self.assertEqual(_attrs(info, expected), expected)
+
     def test_hdr(self):
-        hdrs = glob.glob(os.path.join(imagedir, "*.hdr"))
+        hdrs = _find(imagedir, suffix=".hdr")
         self.assertTrue(len(hdrs) > 0)
         for i, hdr in enumerate(sorted(hdrs)):
             info = imsize.read(Path(hdr))
@@ -126,32 +210,152 @@ class ReadTest(unittest.TestCase):
             self.assertEqual(info.bytedepth, 4)
             self.assertEqual(info.nbytes, info.width * info.height * info.nchan * info.bytedepth)
 
+    def test_hdr_long_header(self):
+        # pad the header with comments so that the blank line ends up just
+        # before the 4 KB mark and the resolution line just after it
+        with open(os.path.join(imagedir, "vinesunset.hdr"), "rb") as f:
+            data = f.read()
+        for blank_line_pos in [4090, 4094, 4095, 5000]:
+            magic, rest = data.split(b"\n", 1)
+            padding = blank_line_pos - data.find(b"\n\n")
+            padded = magic + b"\n#" + b"x" * (padding - 2) + b"\n" + rest
+            self.assertEqual(padded.find(b"\n\n"), blank_line_pos)
+            with _tempfile(padded, ".hdr") as filespec:
+                info = imsize.read(filespec)
+                self.assertEqual((info.width, info.height), (720, 480))
+
     def test_orientations(self):
-        jpegs = sorted(glob.glob(os.path.join(imagedir, "orientations", "*.jpg")))
-        tiffs = sorted(glob.glob(os.path.join(imagedir, "orientations", "*.tif")))
+        jpegs = _find(os.path.join(imagedir, "orientations"), suffix=".jpg")
+        tiffs = _find(os.path.join(imagedir, "orientations"), suffix=".tif")
         self.assertTrue(len(jpegs) == 16)
         self.assertTrue(len(tiffs) == 16)
         for fmt, fileset in zip(["jpeg", "tiff"], [jpegs, tiffs]):
             for i, filespec in enumerate(fileset):
                 info = imsize.read(Path(filespec))
-                self.assertEqual(info.filetype, fmt)
-                self.assertEqual(info.nchan, 3)
                 self.assertTrue(info.width in [600, 450])
                 self.assertTrue(info.height in [600, 450])
-                self.assertEqual(info.bitdepth, 8)
-                self.assertEqual(info.bytedepth, 1)
-                self.assertEqual(info.maxval, 255)
-                self.assertEqual(info.isfloat, False)
-                self.assertEqual(info.uncertain, False)
-                self.assertEqual(info.cfa_raw, False)
-                self.assertEqual(info.nbytes, 600 * 450 * 3)
-                self.assertEqual(info.orientation, (i % 8) + 1)
+                expected = dict(filetype=fmt, nchan=3, bitdepth=8, bytedepth=1, maxval=255, isfloat=False,
+                                uncertain=False, cfa_raw=False, nbytes=600 * 450 * 3, orientation=(i % 8) + 1)
+                self.assertEqual(_attrs(info, expected), expected)
+
+    def test_jpeg_mpf(self):
+        # a minimal two-image MPF file, as written by e.g. Fujifilm & Nikon cameras
+        def segment(marker, payload):
+            return struct.pack(">BBH", 0xff, marker, len(payload) + 2) + payload
+        exif = b"Exif\x00\x00II*\x00" + struct.pack("<IHHHIHxxI", 8, 1, 0x0112, 3, 1, 6, 0)  # orientation=6
+        mpf = b"MPF\x00MM\x00*" + struct.pack(">IH", 8, 3)
+        mpf += struct.pack(">HHI4s", 45056, 7, 4, b"0100")  # MPFVersion
+        mpf += struct.pack(">HHII", 45057, 4, 1, 2)  # NumberOfImages
+        mpf += struct.pack(">HHII", 45058, 7, 32, 50) + struct.pack(">I", 0)  # MPEntry, next IFD
+        mpf_pos = 2 + len(segment(0xe1, exif)) + 4
+        sof = segment(0xc0, struct.pack(">BHHB", 8, 480, 640, 3) + bytes(9))
+        second = b"\xff\xd8" + segment(0xc0, struct.pack(">BHHB", 8, 120, 160, 3) + bytes(9)) + b"\xff\xd9"
+        first_size = 2 + len(segment(0xe1, exif)) + len(segment(0xe2, mpf + bytes(32))) + len(sof) + 2
+        entries = struct.pack(">IIIHH", 0x20030000, first_size, 0, 0, 0)
+        entries += struct.pack(">IIIHH", 0x00020002, len(second), first_size - mpf_pos - 4, 0, 0)
+        data = b"\xff\xd8" + segment(0xe1, exif) + segment(0xe2, mpf + entries) + sof + b"\xff\xd9" + second
+        self.assertEqual(len(data), first_size + len(second))
+        with _tempfile(data, ".jpg") as filespec:
+            info = imsize.read(filespec)
+            expected = dict(filetype="jpeg", width=640, height=480, nchan=3, bitdepth=8, orientation=6,
+                            multi_picture=True, num_images=2, image_sizes=[first_size, len(second)])
+            self.assertEqual(_attrs(info, expected), expected)
+            self.assertEqual(info.image_offsets[1], first_size)  # relative to the MPF TIFF header
+
+    def test_misnamed_files(self):
+        for filename, filetype, width, height in [("landscape_1.png", "png", 600, 450),
+                                                  ("vinesunset.hdr", "hdr", 720, 480),
+                                                  ("uint16.npy", "npy", 20, 10)]:
+            with open(os.path.join(imagedir, filename), "rb") as f:
+                data = f.read()
+            for ext in [".jpg", ".tif", ".PNG", ""]:
+                with _tempfile(data, ext) as filespec:
+                    info = imsize.read(filespec)
+                    self.assertEqual(info.filetype, filetype)
+                    self.assertEqual(info.width, width)
+                    self.assertEqual(info.height, height)
+
+    def test_non_image_files(self):
+        # text that happens to start with an image magic number: PFM, BMP, PGM, PPM
+        for text in [b"PF is short for ...\n", b"BM25 ranking\n", b"P5 4 3\n", b"P6 of the spec\n"]:
+            for ext, filetype in [(".txt", "txt"), ("", "")]:
+                with _tempfile(text, ext) as filespec:
+                    info = imsize.read(filespec)
+                    expected = dict(filetype=filetype, filesize=len(text), nbytes=len(text), uncertain=True, width=None)
+                    self.assertEqual(_attrs(info, expected), expected)
+
+    def test_read_many(self):
+        pngs = _find(imagedir, suffix=".png")
+        with _tempfile(b"", ".png") as empty:
+            infos = imsize.read_many([pngs[0], empty, pngs[1]])
+            self.assertEqual(len(infos), 3)
+            self.assertEqual(infos[0].filespec, pngs[0])
+            self.assertIsInstance(infos[1], imsize.ImageFileError)
+            self.assertEqual(infos[2].filespec, pngs[1])
+
+    def test_cache(self):
+        png = os.path.join(imagedir, "landscape_1.png")
+        info = imsize.read(png)
+        info.width = 0
+        info.image_sizes.append(0)
+        again = imsize.read(png)
+        self.assertEqual(again.width, 600)
+        self.assertEqual(again.image_sizes, [again.filesize])
+        imsize.clear_cache()
+        self.assertEqual(imsize.read(png).width, 600)
+
+    def test_open_once(self):
+        # the file that was opened for detecting the file type is parsed as is
+        imsize.clear_cache()
+        for name in ["landscape_1.png", "sample_640x426.bmp", "vinesunset.hdr", "GrayRampsDiagonal.exr",
+                     os.path.join("orientations", "landscape_6.jpg"), os.path.join("orientations", "portrait_3.tif")]:
+            with mock.patch("builtins.open", wraps=open) as opened:
+                imsize.read(os.path.join(imagedir, name))
+            self.assertEqual(opened.call_count, 1, name)
+        with _tempfile(bytes(400 * 300 * 2), ".raw") as filespec, mock.patch("builtins.open", wraps=open) as opened:
+            imsize.read(filespec, fast=True)  # no magic number => no probing
+            self.assertEqual(opened.call_count, 0)
+        header = b"{'descr': '<u2', 'fortran_order': False, 'shape': (10, 20), }".ljust(8191) + b"\n"
+        with _tempfile(b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header + bytes(10 * 20 * 2), ".npy") as filespec:
+            info = imsize.read(filespec)  # header longer than the head
+            self.assertEqual((info.width, info.height, info.bitdepth), (20, 10, 16))
+
+    def test_fast(self):
+        # headerless 400 x 300 raw with 14-bit pixel values
+        with _tempfile(struct.pack("<H", 16000) * (400 * 300), ".raw") as filespec:
+            self.assertEqual(imsize.read(filespec).bitdepth, 14)
+            info = imsize.read(filespec, fast=True)
+            self.assertEqual((info.width, info.height, info.bitdepth), (400, 300, 12))
+            self.assertEqual(info.uncertain, True)
+
+    def test_bytes_filespec(self):
+        # the file type of a headerless raw can only come from the extension
+        with _tempfile(bytes(400 * 300 * 2), ".raw") as filespec:
+            info = imsize.read(os.fsencode(filespec), fast=True)
+            self.assertEqual(info.filetype, "raw")
+            self.assertEqual(info.filespec, os.fsencode(filespec))
+            self.assertEqual((info.width, info.height), (400, 300))
+            info = imsize.read(os.fsencode(filespec))  # bit depth estimated from pixels
+            expected = dict(filetype="raw", width=400, height=300, bitdepth=10)  # all-zero pixels => 10 bits
+            self.assertEqual(_attrs(info, expected), expected)
+        png = os.fsencode(os.path.join(imagedir, "landscape_1.png"))
+        info = imsize.read(png)
+        self.assertEqual((info.filetype, info.filespec, info.width), ("png", png, 600))
+        with _tempfile(b"not a png", ".png") as filespec:
+            with self.assertRaisesRegex(imsize.ImageFileError, f"^File {filespec} is not"):
+                imsize.read(os.fsencode(filespec))
+
+    def test_lazy_imports(self):
+        # heavy third-party backends must only be imported when needed
+        code = "import sys, imsize; print(sorted({'rawpy', 'pyexiv2', 'exiftool', 'numpy'} & set(sys.modules)))"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "[]")
 
     def test_empty_files(self):
         for ext in imsize.FILETYPES:
-            with tempfile.NamedTemporaryFile(suffix=ext) as fp:
+            with _tempfile(b"", ext) as filespec:
                 with self.assertRaises(imsize.ImageFileError):
-                    info = imsize.read(fp.name)
+                    imsize.read(filespec)
 
 
 if __name__ == "__main__":